@@ -21,7 +21,7 @@ import tools
 if __name__ == "__main__":
 
     if len(sys.argv) == 1:
-        print __doc__
+        print(__doc__)
         sys.exit()
 
     # taps de salida deseados (PDTE PASAR COMO ARGUMENTO)
@@ -34,14 +34,14 @@ if __name__ == "__main__":
     # Leemos el impulso de entrada imp1
     fs, imp1 = tools.readWAV(f_in)
 
-    # Espectro completo
-    h = tools.scipy.fft.fft(imp1)
-    # Réplica del espectro completo en fase mínima
-    hmp = tools.pydsd.minphsp(h)
+    # Semiespectro de frecuencias positivas (el impulso es real)
+    n = len(imp1)
+    h = tools.scipy.fft.rfft(imp1)
+    # Réplica del semiespectro en fase mínima (cepstrum real)
+    hmp = tools.pydsd.minphssp(np.abs(h), n)
 
-    # Convertimos el espectro completo mp en un IR, se toma la parte real.
-    imp2 = tools.scipy.fft.ifft( hmp )
-    imp2 = np.real(imp2)
+    # Convertimos el semiespectro mp en un IR real.
+    imp2 = tools.scipy.fft.irfft( hmp, n )
 
     # Lo cortamos a la longitud deseada y aplicamos una ventana:
     imp2 = tools.pydsd.semiblackmanharris(m) * imp2[:m]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+    A binary storage format for the EQ curve tables, as an alternative
+    to the '.dat' text files.
+
+    A curve store is a folder with:
+
+        curves.json     a small header: fs, series and the tables info
+        freq.npy        the frequency values (float64)
+        <table>.npy     one file per curves table (float32), e.g.
+                        bass_mag.npy, ref_83_loudness_pha.npy, ...
+
+    The tables are loaded as read only memory maps, so that no data
+    is read from disk until it is accessed (zero-copy).
+
+    Several generators can save their tables in the same store, as far
+    as they share the same fs and series.
+"""
+
+import os
+import json
+import numpy as np
+
+HEADER = 'curves.json'
+
+
+def save(folder, freqs, tables, fs, series, rows=None):
+    """ Saves the 'tables' dictionary {name: array} into the 'folder' store.
+
+        'rows' is an optional dictionary {name: list of row names}
+        for tables whose rows are named curves (e.g. the room curves).
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    header = {'fs': fs, 'series': series, 'tables': {}}
+
+    # Tables from other generators in this folder are kept
+    if os.path.isfile(f'{folder}/{HEADER}'):
+        with open(f'{folder}/{HEADER}', 'r') as f:
+            old = json.load(f)
+        if old['fs'] == fs and old['series'] == series:
+            header['tables'] = old['tables']
+
+    np.save(f'{folder}/freq.npy', np.asarray(freqs, dtype='float64'))
+
+    for name, table in tables.items():
+        table = np.asarray(table, dtype='float32')
+        np.save(f'{folder}/{name}.npy', table)
+        header['tables'][name] = {'shape': list(table.shape)}
+        if rows and name in rows:
+            header['tables'][name]['rows'] = list(rows[name])
+
+    with open(f'{folder}/{HEADER}', 'w') as f:
+        json.dump(header, f, indent=4)
+
+
+def load(folder, names=None):
+    """ Loads a curve store,
+        returns a tuple: (header, freqs, tables)
+
+        'tables' is a dictionary of read only memory mapped arrays,
+        'names' can be used to load only some of the tables.
+    """
+    with open(f'{folder}/{HEADER}', 'r') as f:
+        header = json.load(f)
+
+    freqs = np.load(f'{folder}/freq.npy')
+
+    if names is None:
+        names = header['tables'].keys()
+
+    tables = {}
+    for name in names:
+        tables[name] = np.load(f'{folder}/{name}.npy', mmap_mode='r')
+
+    return header, freqs, tables
+
+
+def is_store(folder):
+    return os.path.isfile(f'{folder}/{HEADER}')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+    A content-addressed on-disk cache for the convolver_eq curve sets.
+
+    The curve generators (tones.py, room_curves.py and
+    loudness_compensation_curves.py) store their computed arrays here,
+    keyed by a hash of the generator name, its parameters and the code
+    version (the source of the involved modules). A repeated run with
+    the same parameters and code will load the arrays from the cache.
+
+    The cache folder is ~/.cache/audiotools/convolver_eq, or the one
+    given in the AUDIOTOOLS_CACHE environment variable.
+
+    The cache size is limited to CACHE_MAXBYTES, the least recently used
+    entries are evicted when exceeded.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+CACHE_DIR = os.environ.get( 'AUDIOTOOLS_CACHE',
+                            os.path.expanduser('~/.cache/audiotools/convolver_eq') )
+
+CACHE_MAXBYTES = 512 * 2**20
+
+
+def code_version(*modules):
+    """ A hash of the source files of the given modules,
+        modules can be given as file paths or as imported module names.
+    """
+    h = hashlib.sha1()
+    for m in modules:
+        fpath = m if os.path.isfile(m) else sys.modules[m].__file__
+        with open(fpath, 'rb') as f:
+            h.update( f.read() )
+    return h.hexdigest()
+
+
+def make_key(name, params, code=''):
+    """ The hash key for a generator 'name', its 'params' dictionary
+        and its 'code' version.
+    """
+    def default(x):
+        # numpy values are not JSON serializable
+        if isinstance(x, np.ndarray):
+            return x.tolist()
+        return x.item()
+
+    content = json.dumps( {'name': name, 'params': params, 'code': code},
+                          sort_keys=True, default=default )
+
+    return hashlib.sha1( content.encode() ).hexdigest()
+
+
+def get(name, params, code=''):
+    """ Returns a dictionary of the cached arrays, or None if not cached
+    """
+    fpath = f'{CACHE_DIR}/{make_key(name, params, code)}.npz'
+
+    if not os.path.isfile(fpath):
+        return None
+
+    try:
+        with np.load(fpath) as npz:
+            arrays = { k: npz[k] for k in npz.files }
+    except Exception as e:
+        print(f'(curves_cache) discarding a bad cache file: {e}')
+        try:
+            os.remove(fpath)
+        except OSError:
+            pass
+        return None
+
+    # Touching the file marks it as recently used
+    # (a read only cache is still usable)
+    try:
+        os.utime(fpath)
+    except OSError:
+        pass
+
+    return arrays
+
+
+def put(name, params, arrays, code=''):
+    """ Stores a dictionary of arrays, then evicts the least recently
+        used entries if the cache exceeds CACHE_MAXBYTES.
+    """
+    fpath = f'{CACHE_DIR}/{make_key(name, params, code)}.npz'
+    tmp = f'{fpath}.{os.getpid()}.tmp.npz'
+
+    # An unwritable cache only skips caching
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+
+        # Writing to a temporary file then renaming, so that a concurrent
+        # run never reads a partially written file.
+        np.savez(tmp, **arrays)
+        os.replace(tmp, fpath)
+
+    except OSError as e:
+        print(f'(curves_cache) not cached: {e}')
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        return
+
+    evict()
+
+
+def evict(maxbytes=None):
+    """ Removes the least recently used entries until
+        the cache size is below 'maxbytes' (default CACHE_MAXBYTES)
+    """
+    if maxbytes is None:
+        maxbytes = CACHE_MAXBYTES
+
+    entries = []
+    for fname in os.listdir(CACHE_DIR):
+        if not fname.endswith('.npz') or '.tmp.' in fname:
+            continue
+        try:
+            st = os.stat(f'{CACHE_DIR}/{fname}')
+        except FileNotFoundError:
+            continue
+        entries.append( (st.st_mtime, st.st_size, fname) )
+
+    total = sum( e[1] for e in entries )
+
+    for _, size, fname in sorted(entries):
+        if total <= maxbytes:
+            break
+        try:
+            os.remove(f'{CACHE_DIR}/{fname}')
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def clear():
+    """ Removes all cached entries
+    """
+    if os.path.isdir(CACHE_DIR):
+        evict(maxbytes=0)
@@ -7,11 +7,21 @@
 
     Currently the curves are stored in a Pythonic way, so the loaded data
     with numpy.loadtxt() will be indexed in a natural order.
+
+    Also converts a folder of '.dat' curves, as saved by tones.py,
+    room_curves.py or loudness_compensation_curves.py, into a binary
+    curve store (see curve_store.py):
+
+        dat_convert.py  --store  path/to/curves_44100_R20  [fs] [series]
+
+    fs and series are taken from the folder name if not given.
 """
 
 import numpy as np
 import os
 import sys
+from glob import glob
+import curve_store
 
 
 # Put here the filenames you want yo convert:
@@ -25,11 +35,63 @@ loudness_fnames = [ 'R20_ext-loudness_mag.dat',
                     'R20_ext-loudness_pha.dat' ]
 
 
+def dat2store(folder, fs=None, series=None):
+    """ Converts the '.dat' curves found in 'folder' into a binary curve store
+        in the same folder.
+
+        Multicurve files (e.g. bass_mag.dat) are converted into a table
+        with the same name. Single curve files (e.g. +4.0-0.0_target_mag.dat)
+        are gathered into a table named after the file name suffix
+        (e.g. target_mag), the row names are kept in the store header.
+    """
+    if fs is None or series is None:
+        # e.g.: curves_44100_R20 or curves_44100_R20/room_target
+        parts = os.path.abspath(folder).split('/')
+        name = [ p for p in parts if p.startswith('curves_') ][-1]
+        _, fs0, series0 = name.split('_')
+        fs      = fs     or int(fs0)
+        series  = series or series0
+
+    freqs = np.loadtxt(f'{folder}/freq.dat')
+
+    tables  = {}
+    rows    = {}
+
+    for fpath in sorted( glob(f'{folder}/*.dat') ):
+
+        fname = os.path.basename(fpath)[:-4]
+        if fname == 'freq':
+            continue
+
+        curve = np.loadtxt(fpath)
+
+        if curve.ndim == 2:
+            tables[fname] = curve
+
+        else:
+            row, tname = fname.split('_', 1)
+            if tname not in tables:
+                tables[tname] = []
+                rows[tname] = []
+            tables[tname].append(curve)
+            rows[tname].append(row)
+
+    curve_store.save(folder, freqs, tables, fs=fs, series=series, rows=rows)
+
+    print(f'{len(tables)} tables saved to binary store: {folder}')
+
+
 if __name__ == '__main__':
 
+    if sys.argv[1:2] == ['--store']:
+        args = sys.argv[2:] + [None, None]
+        fs = int(args[1]) if args[1] else None
+        dat2store(args[0], fs=fs, series=args[2])
+        sys.exit()
+
     os.mkdir('converted')
 
-    for f1 in tone_dat_fnames:
+    for f1 in tone_fnames:
 
         x = np.loadtxt(f1)
 
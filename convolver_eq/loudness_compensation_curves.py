@@ -13,7 +13,7 @@
 
     Usage:
 
-    loudness_compensation_curves.py   -RXX  -ref=X,Y,...  -fs=X     --save  --plot
+    loudness_compensation_curves.py   -RXX  -ref=X,Y,...  -fs=X     --save  --bin  --plot
 
         -RXX            R10 | R20 | R40 | R80  iso R series (default: R20 ~ 1/3 oct)
 
@@ -27,6 +27,10 @@
 
         --save          save curves to disk
 
+        --bin           save curves to disk as a binary curve store (see curve_store.py)
+
+        --nocache       do not use the curves cache (~/.cache/audiotools/convolver_eq)
+
 """
 
 import sys
@@ -40,14 +44,18 @@ HOME = os.path.expanduser("~")
 sys.path.append(f'{HOME}/audiotools')
 import iso226
 from iso_R import get_iso_R
-from tools import extrap1d, min_phase_from_real_mag
+from tools import extrap1d, min_phase_from_real_mag_batch
 from smoothSpectrum import smoothSpectrum as smooth
+import curves_cache
+import curve_store
 
 # Default parameters
 refSPL  = 83
 Rseries = 'R20'
 plot    = False
 save    = False
+savebin = False
+nocache = False
 fmin    = 10
 fs      = 44100
 
@@ -99,13 +107,7 @@ def doplot():
 
 def phase_from_mag(freqs, curves):
 
-    phases = np.zeros( curves.shape )
-
-    for i, curve in enumerate(curves):
-
-        _,_,pha = min_phase_from_real_mag( freqs, curve, fs=fs)
-
-        phases[i] = pha
+    _,_,phases = min_phase_from_real_mag_batch( freqs, curves, fs=fs)
 
     return phases
 
@@ -122,18 +124,27 @@ def save_curves():
     print(f'loudness curves for refSPL={refSPL} saved to: {CFOLDER}')
 
 
+def save_store():
+
+    curve_store.save( CFOLDER, freqs,
+                      { f'ref_{refSPL}_loudness_mag': loudcomp_mag,
+                        f'ref_{refSPL}_loudness_pha': loudcomp_pha },
+                      fs=fs, series=Rseries )
+
+    print(f'loudness curves for refSPL={refSPL} saved to binary store: {CFOLDER}')
+
+
 def extend_curves(freqs, curves, new_freqs, Noct=0):
     """ Extrapolates (freqs,curves) by using  a new frequency bands 'new_freqs'.
         Noct will smooth the resulting curves in 1/Noct, Noct=0 will not.
     """
-    new_curves = np.zeros( (curves.shape[0], len(new_freqs)) )
-    for i, curve in enumerate(curves):
-        I = interp1d(freqs, curve)
-        X = extrap1d( I )
-        if Noct:
-            new_curves[i] = smooth(new_freqs, X(new_freqs), Noct)
-        else:
-            new_curves[i] = X(new_freqs)
+    # interpolating and extrapolating all curves at once
+    I = interp1d(freqs, curves)
+    X = extrap1d( I )
+    new_curves = X(new_freqs)
+    # smoothing all curves at once
+    if Noct:
+        new_curves = smooth(new_freqs, new_curves, Noct)
     return new_curves
 
 
@@ -141,6 +152,21 @@ def make_curves():
 
     global freqs, loudcomp_mag, loudcomp_pha
 
+    # Repeated runs with the same parameters and code are loaded from cache
+    params = {  'Rseries':  Rseries,
+                'fs':       fs,
+                'fmin':     fmin,
+                'refSPL':   refSPL  }
+    code = curves_cache.code_version(__file__, 'iso226', 'iso_R', 'tools',
+                                     'smoothSpectrum', 'pydsd')
+
+    cached = None if nocache else curves_cache.get('loudness', params, code)
+    if cached:
+        freqs        = cached['freqs']
+        loudcomp_mag = cached['loudcomp_mag']
+        loudcomp_pha = cached['loudcomp_pha']
+        print( f'(equal_loudness) refSPL={refSPL} curves loaded from cache' )
+        return
 
     if Rseries[0]== 'R':
         freqs = get_iso_R(Rseries, fmin=fmin, fs=fs)
@@ -175,6 +201,13 @@ def make_curves():
 
     print( '(equal_loudness) done.' )
 
+    if not nocache:
+        curves_cache.put( 'loudness', params,
+                          { 'freqs':        freqs,
+                            'loudcomp_mag': loudcomp_mag,
+                            'loudcomp_pha': loudcomp_pha    },
+                          code )
+
 
 if __name__ == '__main__':
 
@@ -188,6 +221,12 @@ if __name__ == '__main__':
             print(__doc__)
             sys.exit()
 
+        elif opc == '--nocache':
+            nocache = True
+
+        elif opc == '--bin':
+            savebin = True
+
         elif '-ref=' in opc:
             refSPL = opc.split('=')[-1]
 
@@ -229,6 +268,8 @@ if __name__ == '__main__':
         make_curves()
         if save:
             save_curves()
+        if savebin:
+            save_store()
         if plot:
             doplot()
 
@@ -5,7 +5,7 @@
 
     Usage:
 
-    room_curves.py   -RXX  -fs=X  -loS=X  -loF=X  -hiF=X   --save  --plot
+    room_curves.py   -RXX  -fs=X  -loS=X  -loF=X  -hiF=X   --save  --bin  --plot
 
         -RXX    R10 | R20 | R40 | R80  iso R series (default: R20 ~ 1/3 oct)
 
@@ -22,8 +22,16 @@
 
         --save  save curves to disk
 
+        --bin   save curves to disk as a binary curve store (see curve_store.py),
+                all curves go into the 'target_mag' and 'target_pha' tables
+
         --plot
 
+        --jobs=N  spread the curves computation over N processes
+                  (default: 1, N=0 uses all cpu cores)
+
+        --nocache do not use the curves cache (~/.cache/audiotools/convolver_eq)
+
 
     Note:
 
@@ -37,6 +45,8 @@
 
 import sys
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from scipy.signal import freqz
 from matplotlib import pyplot as plt
@@ -45,7 +55,9 @@ HOME = os.path.expanduser("~")
 sys.path.append(f'{HOME}/audiotools')
 from iso_R import get_iso_R
 from smoothSpectrum import smoothSpectrum
-from tools import shelf1low, shelf2low, min_phase_from_real_mag
+from tools import shelf1low, shelf2low, min_phase_from_real_mag_batch
+import curves_cache
+import curve_store
 
 
 # Defaults
@@ -74,13 +86,15 @@ def make_low(fc, gain):
     return 20 * np.log10( np.abs(h) )
 
 
-def make_high(fc, gain):
-    curve = np.zeros( len(freqs) )
-    i0 = len(curve[ freqs < fc ])
-    for i, g in enumerate(curve):
-        if i > i0:
-            curve[i] = (i-i0) * gain / (len(curve)-i0)
-    return smoothSpectrum(freqs, curve, Noct=2)
+def make_high(fc, gains):
+    """ The high roll-off curves for all gains, smoothed in one pass,
+        returns an array (gains x freqs)
+    """
+    i0 = len(freqs[ freqs < fc ])
+    ramp = np.arange( len(freqs) ) - i0
+    ramp[ :i0 + 1 ] = 0
+    curves = np.outer( gains, ramp / (len(freqs) - i0) )
+    return smoothSpectrum(freqs, curves, Noct=2)
 
 
 def plotsamples():
@@ -109,14 +123,64 @@ def plotsamples():
     plt.show()
 
 
+def make_row(lo_gain):
+    """
+    The curves for a given lo_gain along all hi_gains,
+    returns a tuple: (names, mags, phas)
+
+    (i) the hi_gains curves table 'his' is computed once in make_curves()
+    """
+    clo     = make_low( fc=fc_low, gain=lo_gain )
+    names   = []
+    hc_mags = his + clo
+
+    for hi_gain in hi_gains:
+        lo_str = str(round(float(lo_gain), 1))
+        hi_str = str(round(float(hi_gain), 1))
+        hi_str = f'-{hi_str}'.replace('--', '-')
+        names.append( f'+{lo_str}{hi_str}' )
+
+    # the phase is retrieved for the whole row at once
+    _,_,hc_phas = min_phase_from_real_mag_batch( freqs, hc_mags, fs=fs)
+
+    return names, hc_mags, hc_phas
+
+
+def init_worker(params):
+    """ Worker processes need the same settings as the main one
+    """
+    globals().update(params)
+
+
 def make_curves():
     """
     curves stored in a dictionary
     """
 
-    print(f'cumputing a full set of curves, will take a while ...')
+    global freqs, curves, his
+
+    # Repeated runs with the same parameters and code are loaded from cache
+    cache_params = {'Rseries':      Rseries,
+                    'fs':           fs,
+                    'fmin':         fmin,
+                    'shelf_order':  shelf_order,
+                    'fc_low':       fc_low,
+                    'fc_high':      fc_high,
+                    'lo_gains':     lo_gains,
+                    'hi_gains':     hi_gains    }
+    code = curves_cache.code_version(__file__, 'iso_R', 'tools',
+                                     'smoothSpectrum', 'pydsd')
+
+    cached = None if nocache else curves_cache.get('room', cache_params, code)
+    if cached:
+        freqs  = cached['freqs']
+        curves = {}
+        for name, mag, pha in zip(cached['names'], cached['mags'], cached['phas']):
+            curves[str(name)] = {'mag': mag, 'pha': pha}
+        print('curves loaded from cache')
+        return
 
-    global freqs, curves
+    print(f'cumputing a full set of curves, will take a while ...')
 
 
     if Rseries[0]== 'R':
@@ -131,18 +195,60 @@ def make_curves():
         print('Error in -Nxx / -Rxx parameter')
         sys.exit()
 
+    t0 = time.time()
+
+    # The high roll-off curves do not depend on lo_gain, so they are
+    # computed once for all rows
+    his = make_high( fc=fc_high, gains=hi_gains )
+
+    # One row of curves (all hi_gains) for each lo_gain
+    if jobs == 1:
+
+        rows = []
+        for lo_gain in lo_gains:
+            rows.append( make_row(lo_gain) )
+            print(f'    {len(rows)}/{len(lo_gains)} rows done', end='\r')
+
+    else:
+
+        params = {  'freqs':        freqs,
+                    'fs':           fs,
+                    'shelf_order':  shelf_order,
+                    'fc_low':       fc_low,
+                    'fc_high':      fc_high,
+                    'hi_gains':     hi_gains,
+                    'his':          his         }
+
+        with ProcessPoolExecutor( max_workers=jobs or None,
+                                  initializer=init_worker,
+                                  initargs=(params,) ) as executor:
+
+            futures = [ executor.submit(make_row, lo_gain) for lo_gain in lo_gains ]
+
+            for n, _ in enumerate(as_completed(futures), 1):
+                print(f'    {n}/{len(lo_gains)} rows done', end='\r')
+
+            # (i) collected in submission order, so the result is deterministic
+            rows = [ future.result() for future in futures ]
+
+    print()
 
     curves = {}
-    for lo_gain in lo_gains:
-        clo = make_low( fc=fc_low, gain=lo_gain )
-        for hi_gain in hi_gains:
-            chi = make_high( fc=fc_high, gain=hi_gain )
-            hc_mag = clo + chi
-            _,_,hc_pha = min_phase_from_real_mag( freqs, hc_mag, fs=fs)
-            lo_str = str(round(float(lo_gain), 1))
-            hi_str = str(round(float(hi_gain), 1))
-            hi_str = f'-{hi_str}'.replace('--', '-')
-            curves[f'+{lo_str}{hi_str}'] = {'mag': hc_mag, 'pha': hc_pha}
+    for names, hc_mags, hc_phas in rows:
+        for name, hc_mag, hc_pha in zip(names, hc_mags, hc_phas):
+            curves[name] = {'mag': hc_mag, 'pha': hc_pha}
+
+    elapsed = time.time() - t0
+    print( f'{len(curves)} curves in {elapsed:.2f} s '
+           f'({len(curves) / elapsed:.1f} curves/s, jobs: {jobs or os.cpu_count()})' )
+
+    if not nocache:
+        curves_cache.put( 'room', cache_params,
+                          { 'freqs':    freqs,
+                            'names':    np.array( [n for row in rows for n in row[0]] ),
+                            'mags':     np.concatenate( [row[1] for row in rows] ),
+                            'phas':     np.concatenate( [row[2] for row in rows] )  },
+                          code )
 
 
 def save_curves():
@@ -161,10 +267,24 @@ def save_curves():
         np.savetxt( pname, pha )
 
 
+def save_store():
+
+    names = list(curves.keys())
+
+    curve_store.save( CFOLDER, freqs,
+                      { 'target_mag': [ curves[n]['mag'] for n in names ],
+                        'target_pha': [ curves[n]['pha'] for n in names ] },
+                      fs=fs, series=Rseries,
+                      rows={ 'target_mag': names, 'target_pha': names } )
+
+
 if __name__ == '__main__':
 
     plot = False
     savetodisk = False
+    savebin = False
+    jobs = 1
+    nocache = False
 
     # Read command line options
     if not sys.argv[1:]:
@@ -209,6 +329,17 @@ if __name__ == '__main__':
             else:
                 raise ValueError('Hi roll-off corner 250 ... 10000 Hz')
 
+        elif opc[:7] == '--jobs=':
+            jobs = int(opc[7:])
+            if jobs < 0:
+                raise ValueError('jobs must be 0 (all cpu cores) or greater')
+
+        elif opc == '--nocache':
+            nocache = True
+
+        elif opc == '--bin':
+            savebin = True
+
         elif opc == '--save' or opc == '-s':
             savetodisk = True
 
@@ -251,8 +382,13 @@ if __name__ == '__main__':
         save_curves()
         print(f'(i) Curves saved to:  {CFOLDER}')
         print(f'    Choose just the ones you need ;-)')
-    else:
-        print('(i) Curves not saved, use --save if needed')
+
+    if savebin:
+        save_store()
+        print(f'(i) Curves saved to binary store:  {CFOLDER}')
+
+    if not savetodisk and not savebin:
+        print('(i) Curves not saved, use --save or --bin if needed')
 
     if plot:
         plotsamples()
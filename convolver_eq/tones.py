@@ -6,7 +6,7 @@
 
     Usage:
 
-    tones.py    -RXX  -fs=X  -o=X -b=X -t=X  --save  --plot
+    tones.py    -RXX  -fs=X  -o=X -b=X -t=X  --save  --bin  --plot
 
         -RXX:   R10 | R20 | R40 | R80  iso R series (default: R20 ~ 1/3 oct)
 
@@ -23,19 +23,24 @@
 
         --save  save curves to disk
 
+        --bin   save curves to disk as a binary curve store (see curve_store.py)
+
         --plot
 
+        --nocache  do not use the curves cache (~/.cache/audiotools/convolver_eq)
+
 """
 import sys
 import os
 import numpy as np
-from scipy.signal import freqz
 from matplotlib import pyplot as plt
 
 HOME = os.path.expanduser("~")
 sys.path.append(f'{HOME}/audiotools')
 from iso_R import get_iso_R
-from tools import shelf1low, shelf2low, shelf1high, shelf2high
+from tools import shelf_response
+import curves_cache
+import curve_store
 
 
 def plot_all():
@@ -87,12 +92,45 @@ def save_curves():
     print(f'freqs saved to:  {CFOLDER}')
 
 
+def save_store():
+
+    curve_store.save( CFOLDER, freqs,
+                      { 'bass_mag':     bass_mag,
+                        'bass_pha':     bass_pha,
+                        'treble_mag':   treble_mag,
+                        'treble_pha':   treble_pha  },
+                      fs=fs, series=Rseries )
+
+    print(f'binary curve store saved to:  {CFOLDER}')
+
+
 def make_curves():
 
     global  freqs,                  \
             bass_mag,   bass_pha,   \
             treble_mag, treble_pha
 
+    # Repeated runs with the same parameters and code are loaded from cache
+    params = {  'Rseries':      Rseries,
+                'fs':           fs,
+                'fmin':         fmin,
+                'shelf_order':  shelf_order,
+                'fc_bass':      fc_bass,
+                'fc_treble':    fc_treble,
+                'span':         span,
+                'step':         step    }
+    code = curves_cache.code_version(__file__, 'tools', 'iso_R')
+
+    cached = None if nocache else curves_cache.get('tones', params, code)
+    if cached:
+        freqs       = cached['freqs']
+        bass_mag    = cached['bass_mag']
+        bass_pha    = cached['bass_pha']
+        treble_mag  = cached['treble_mag']
+        treble_pha  = cached['treble_pha']
+        print('(tones) curves loaded from cache')
+        return
+
     if Rseries[0]== 'R':
         freqs = get_iso_R(Rseries, fmin=fmin, fs=fs)
 
@@ -105,35 +143,26 @@ def make_curves():
         print('Error in -Nxx / -Rxx parameter')
         sys.exit()
 
-    # Prepare curves collection arrays
+    # All the dB steps curves are evaluated at once
     dB_steps = np.arange(-span, span+step ,step)
-    bass_mag    = np.zeros( (len(dB_steps), len(freqs)) )
-    bass_pha    = np.zeros( (len(dB_steps), len(freqs)) )
-    treble_mag  = np.zeros( (len(dB_steps), len(freqs)) )
-    treble_pha  = np.zeros( (len(dB_steps), len(freqs)) )
-
-    for i, dB in enumerate(dB_steps):
-
-        G = 10 ** (dB / 20.0)
-
-        # Compute bass
-        wc = 2 * np.pi * fc_bass / fs
-        b, a = {1: shelf1low, 2:shelf2low}[shelf_order](G, wc)
-        # for compatibility with scipy < v2.x do not use worN= and fs=
-        _, h = freqz( b, a, freqs * 2*np.pi / fs )
-        mag_dB = 20 * np.log10(abs(h))
-        pha_deg = np.angle(h, deg=True)
-        bass_mag[i] = mag_dB
-        bass_pha[i] = pha_deg
-
-        # Compute treble
-        wc = 2 * np.pi * fc_treble / fs
-        b, a = {1: shelf1high, 2:shelf2high}[shelf_order](G, wc)
-        _, h = freqz( b, a, freqs * 2*np.pi / fs )
-        mag_dB = 20 * np.log10(abs(h))
-        pha_deg = np.angle(h, deg=True)
-        treble_mag[i] = mag_dB
-        treble_pha[i] = pha_deg
+    G = 10 ** (dB_steps / 20.0)
+
+    # Compute bass
+    bass_mag, bass_pha = shelf_response( freqs, G, fc_bass, fs,
+                                         order=shelf_order, btype='low' )
+
+    # Compute treble
+    treble_mag, treble_pha = shelf_response( freqs, G, fc_treble, fs,
+                                             order=shelf_order, btype='high' )
+
+    if not nocache:
+        curves_cache.put( 'tones', params,
+                          { 'freqs':        freqs,
+                            'bass_mag':     bass_mag,
+                            'bass_pha':     bass_pha,
+                            'treble_mag':   treble_mag,
+                            'treble_pha':   treble_pha  },
+                          code )
 
 
 if __name__ == '__main__':
@@ -155,6 +184,8 @@ if __name__ == '__main__':
 
     plot        = False
     save        = False
+    savebin     = False
+    nocache     = False
 
     # Read command line options
     if not sys.argv[1:]:
@@ -166,6 +197,12 @@ if __name__ == '__main__':
             print(__doc__)
             sys.exit()
 
+        elif opc == '--nocache':
+            nocache = True
+
+        elif opc == '--bin':
+            savebin = True
+
         elif opc[:2] == '-R' or opc[:2] == '-N':
             Rseries = opc[1:]
 
@@ -212,5 +249,8 @@ if __name__ == '__main__':
     if save:
         save_curves()
 
+    if savebin:
+        save_store()
+
     if plot:
         plot_all()
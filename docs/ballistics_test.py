@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+    Checks the level_meter.Ballistics readings when a tone stops:
+    the meters must fall back at their standard speed, with the same
+    readings for any audio block size.
+
+    Uso:  python3 ballistics_test.py
+"""
+
+# Para que este script pueda estar fuera de ~/audiotools
+import os
+import sys
+HOME = os.path.expanduser("~")
+sys.path.append(HOME + "/audiotools")
+sys.path.append( os.path.dirname(os.path.dirname(os.path.abspath(__file__))) )
+
+import numpy as np
+from level_meter import Ballistics, BALLISTICS
+
+fs          = 48000
+BLOCK_SIZES = (7, 64, 480, 4800)
+
+# 1 s of a 1 KHz tone at -6 dBFS peak, then 2 s of silence
+x = np.zeros( (3 * fs, 2) )
+x[:fs] = 0.5 * np.sin( 2 * np.pi * 1000 * np.arange(fs) / fs )[:, np.newaxis]
+
+
+def reading(kind, bs, t):
+    """ The reading (dB) of the block that contains the time t (s) """
+    b = Ballistics(fs, kind)
+    n = int(t * fs)
+    for i in range(0, len(x), bs):
+        env = b( x[i : i + bs] )
+        if i + bs > n:
+            return 20 * np.log10( max(env[0], 1e-10) )
+
+
+ok = True
+for kind in BALLISTICS:
+
+    fall = BALLISTICS[kind]['fall']
+    # the peak meters are checked 1 s after the tone stops,
+    # the VU meter 500 ms after (it falls as fast as it rises)
+    t = 2.0 if fall else 1.5
+    r = [ reading(kind, bs, t) for bs in BLOCK_SIZES ]
+
+    print( f'{kind:5} {t - 1:.2f} s after the tone: ' +
+           '  '.join( f'{v:8.2f}' for v in r ) + '  dB  (block sizes '
+           f'{BLOCK_SIZES})' )
+
+    # the max over a block is a bit higher for longer blocks
+    spread = max(r) - min(r)
+    if fall:
+        steady = reading(kind, 480, 0.99)
+        expected = steady - fall
+        if spread > 0.1 or abs(r[0] - expected) > 0.1:
+            print(f'      FAIL: expected {expected:.2f} dB')
+            ok = False
+    elif not max(r) < -20:
+        print('      FAIL: the VU meter did not fall')
+        ok = False
+
+print('OK' if ok else 'FAILED')
+sys.exit(0 if ok else 1)
@@ -60,20 +60,35 @@ def amplify( x, gain_dB ):
     return x * gain
 
 def get_coeffs(fs, f0, Q, ftype, dBgain=0.0):
-    """ this calculates coeffs and initial conditions
-        for signal.lfilter to filter audio blocks
+    """ this calculates SOS coeffs and initial conditions
+        for signal.sosfilt to filter audio blocks,
+        arrays of f0, Q, ftype, dBgain will make a multi section filter
     """
-    b, a = pydsd.biquad( fs, f0, Q, ftype, dBgain )
-    zi   = signal.lfilter_zi(b, a)
-    return b, a, zi
-
-def lfilter( x, coeffs):
-    # x is a stereo audio block: x[:,0] -> ch0, x[:,1] -> ch1 
-    b, a, zi = coeffs
-    y = np.copy( x )
-    y[:,0], _ = signal.lfilter( b, a, x[:,0], zi=zi*x[:,0][0] )
-    y[:,1], _ = signal.lfilter( b, a, x[:,1], zi=zi*x[:,1][0] )
-    return y
+    sos = pydsd.biquad_sos( fs, f0, Q, ftype, dBgain )
+    zi  = signal.sosfilt_zi(sos)
+    return sos, zi
+
+class SOS_filter(object):
+    """ A multi section filter for consecutive audio blocks,
+        the filter state is kept from one block to the next one.
+
+        f = SOS_filter( get_coeffs(fs, f0, Q, ftype, dBgain) )
+        y = f(x)        x is an audio block: x[:,0] -> ch0, x[:,1] -> ch1 ...
+    """
+
+    def __init__(self, coeffs):
+        self.sos, self.zi0 = coeffs
+        self.reset()
+
+    def reset(self):
+        self.zi = None
+
+    def __call__(self, x):
+        if self.zi is None or self.zi.shape[2:] != x.shape[1:]:
+            # steady state for the first sample, only at the start
+            self.zi = self.zi0[:,:,np.newaxis] * x[0]
+        y, self.zi = signal.sosfilt( self.sos, x, axis=0, zi=self.zi )
+        return y
 
 if __name__ == '__main__':
 
@@ -87,9 +102,9 @@ if __name__ == '__main__':
     channels   = sd.query_devices(args.input_device, 'input')['max_input_channels']
     bs  = int(fs * args.block_duration / 1000)
 
-    # precalculating coeffs for scipy.lfilter
-    hpf_coeffs =    get_coeffs(fs, 100,  .707, 'hpf'            )
-    hshelf_coeffs = get_coeffs(fs, 1000, .707, 'highshelf', 4.0 )
+    # precalculating coeffs for scipy.sosfilt (100Hz HPF + 1000Hz High Shelf +4dB)
+    k_filter = SOS_filter( get_coeffs(fs, [100, 1000], .707, ['hpf', 'highshelf'],
+                                      [0.0, 4.0]) )
 
     # Main loop: open a fullduplex audio stream for processing the audio blocks
     with sd.Stream(device=(args.input_device, args.output_device), 
@@ -105,8 +120,7 @@ if __name__ == '__main__':
             indata = qIn.get()
             
             # DSP: applying some filters
-            filtered = lfilter( indata,   hpf_coeffs)
-            filtered = lfilter( filtered, hshelf_coeffs)
+            filtered = k_filter( indata )
 
             # Putting filtered audio blocks into the output queue
             qOut.put( filtered )
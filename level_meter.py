@@ -21,13 +21,20 @@
     To view suported devices use '-l' option
 
 """
-import sys
 import argparse
 import numpy as np
+from scipy import signal, sparse
 import queue
 import threading
+import asyncio
+from functools import lru_cache
+from spsc_ring import SPSCRing
+from iso_R import get_iso_R
 # Thanks to https://python-sounddevice.readthedocs.io
-import sounddevice as sd
+try:
+    import sounddevice as sd
+except Exception:
+    sd = None
 
 
 def int_or_str(text):
@@ -52,121 +59,855 @@ def parse_cmdline():
 
     parser.add_argument('-m', '--mode', type=str,
             default='rms',
-            help='\'rms\' or \'peak\'')
+            help='\'rms\', \'peak\', \'truepeak\' (4x oversampled, dBTP) '
+                 '\'rta\' (fractional octave bands), '
+                 '\'vu\', \'ppm1\', \'ppm2\', \'ebu\' meter ballistics, '
+                 'or \'spl\' (A/C/Z weighted dB SPL)')
+
+    parser.add_argument('-w', '--weighting', type=str, default='A',
+            help='spl frequency weighting: \'A\', \'C\' or \'Z\' (default: A)')
+
+    parser.add_argument('-i', '--integration', type=str, default='fast',
+            help='spl time weighting: \'fast\', \'slow\' or \'leq\' (default: fast)')
+
+    parser.add_argument('-cal', '--calibration', type=float, default=0.0,
+            help='spl calibration offset in dB (default: 0)')
+
+    parser.add_argument('-s', '--serie', type=str, default='1/3',
+            help='rta bands: \'1/3\', \'1/6\', \'1/12\' or \'1/24\' octave (default: 1/3)')
+
+    parser.add_argument('-t', '--tau', type=float, default=0.0,
+            help='rta averaging time constant in seconds (default: 0, no averaging)')
+
+    parser.add_argument('-cb', '--callback_metering', action='store_true',
+            help='accumulate levels inside the audio callback')
+
+    parser.add_argument('-ch', '--channels', type=int, default=2,
+            help='channels to measure (default: 2)')
 
     args = parser.parse_args()
 
     if args.list_devices:
+        if sd is None:
+            parser.exit(1, 'sounddevice is not available\n')
         print(sd.query_devices())
         parser.exit(0)
 
     return args
 
 
-class Meter(object):
+class TruePeak(object):
     """
-        Measures the signal level of an audio stream from a system sound device.
+        True peak meter as per ITU-R BS.1770 Annex 2, the signal is 4x
+        oversampled by a polyphase FIR filter, then the max absolute value
+        is taken.
+
+        The filter history is kept from one block to the next one,
+        all channels and phases are computed at once.
+
+        tp = TruePeak()
+
+        peaks = tp(x)       x: audio block x[:, channel]
+                            peaks: the linear true peak of each channel
+
+        .reset()            Reset the filter history
+    """
+
+
+    # Max input samples to be oversampled at once
+    SEGMENT = 2**14
+
+
+    def __init__(self, up=4):
+        # Low pass FIR at the original Nyquist freq, as per
+        # scipy.signal.resample_poly, with unity gain for the upsampled signal
+        h = signal.firwin( 20 * up + 1, 1.0 / up, window=('kaiser', 5.0) ) * up
+        # Zero padded to split it in 'up' phases of K taps
+        h = np.concatenate( (h, np.zeros( -len(h) % up )) )
+        self.K = len(h) // up
+        # phase p taps are h[p], h[p + up], h[p + 2*up] ...
+        # (i) reversed, so that the filter runs as a dot product
+        #     over the sliding windows of the input signal
+        self.phases = h.reshape(self.K, up)[::-1]
+        self.reset()
+
+
+    def reset(self):
+        self.hist = None
+
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype='float64')
+        if x.ndim == 1:
+            x = x.reshape(-1, 1)
+        if self.hist is None or self.hist.shape[1] != x.shape[1]:
+            self.hist = np.zeros( (self.K - 1, x.shape[1]) )
+
+        xx = np.concatenate( (self.hist, x) )
+        self.hist = xx[ len(xx) - (self.K - 1) : ]
+
+        # (i) channels first, so that each channel windows are contiguous
+        xx = np.ascontiguousarray(xx.T)
+
+        # windows[channel, n, :] = xx[channel, n : n + K]
+        windows = np.lib.stride_tricks.sliding_window_view(xx, self.K, axis=1)
+
+        peaks = np.zeros( len(xx) )
+
+        # Long blocks are processed by segments to limit the memory used
+        for i in range(0, windows.shape[1], self.SEGMENT):
+            # y[channel, n, phase], then flattened for each channel
+            y = ( windows[:, i : i + self.SEGMENT] @ self.phases ).reshape(len(xx), -1)
+            peaks = np.maximum( peaks, np.maximum( y.max(axis=1), -y.min(axis=1) ) )
+
+        return peaks
+
+
+# Meter ballistics:
+#   'integration'   attack integration time in seconds: a tone burst of
+#                   this duration reads 2 dB below its steady reading
+#                   (IEC 60268-10), or the VU 99% rise time (IEC 60268-17)
+#   'fall'          return speed in dB/s, None for a VU symmetric response
+BALLISTICS = {
+    'vu':   {'integration': 0.300,  'fall': None        },  # VU meter
+    'ppm1': {'integration': 0.005,  'fall': 20 / 1.5    },  # PPM type I (DIN)
+    'ppm2': {'integration': 0.010,  'fall': 24 / 2.8    },  # PPM type II (BBC, EBU)
+    'ebu':  {'integration': 0.0,    'fall': 20 / 1.7    }   # digital PPM (IEC 60268-18)
+}
+
+
+class Ballistics(object):
+    """
+        VU and PPM meters ballistics (see BALLISTICS), as vectorized envelope
+        followers of the rectified signal, all channels at once.
+
+        The attack is a linear integrator (scipy.signal.lfilter), then the
+        peak meters fall back at a constant dB/s speed:
+
+            env[n] = max( att[n], env[n-1] - fall )
+
+        computed in the log domain as a running maximum (np.maximum.accumulate).
+        The filter and envelope states are kept from one block to the next one.
+
+        The readings are calibrated with a sine: VU meters read its rms,
+        PPMs read its peak. The PPM integrators average the rectified signal,
+        so their readings of low frequency tones and transients are
+        approximated.
+
+        b = Ballistics(fs, kind='ppm2')
+
+        env = b(x)      x: audio block x[:, channel]
+                        env: the max linear reading of each channel
+                             along the block
+
+        .reset()        Reset the meter to zero
+    """
+
+
+    def __init__(self, fs, kind='ppm2'):
+
+        if kind not in BALLISTICS:
+            raise ValueError(f'bad ballistics \'{kind}\', use one of {tuple(BALLISTICS)}')
+
+        self.kind   = kind
+        T           = BALLISTICS[kind]['integration']
+        fall        = BALLISTICS[kind]['fall']
+
+        if fall is None:
+            # VU: two critically damped poles, 99% of the step response
+            # 1 - (1 + t/tau) exp(-t/tau) at the rise time
+            tau     = T / 6.638
+            p       = np.exp( -1 / (fs * tau) )
+            self.b  = np.array( [(1 - p) ** 2] )
+            self.a  = np.array( [1, -2 * p, p ** 2] )
+            # rectified average to the rms of a sine
+            self.gain = np.pi / (2 * np.sqrt(2))
+            self.fall = None
+
+        else:
+            if T:
+                # one pole, a burst of T seconds reads 1 - exp(-T/tau) = -2 dB
+                tau     = T / -np.log( 1 - 10 ** (-2 / 20) )
+                p       = np.exp( -1 / (fs * tau) )
+                self.b  = np.array( [1 - p] )
+                self.a  = np.array( [1, -p] )
+                # rectified average to the peak of a sine
+                self.gain = np.pi / 2
+            else:
+                # sample peak
+                self.b  = None
+                self.gain = 1.0
+            # dB per sample
+            self.fall = fall / fs
+
+        self.reset()
+
+
+    def reset(self):
+        self.zi     = None
+        self.env    = None
+
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype='float64')
+        if x.ndim == 1:
+            x = x.reshape(-1, 1)
+        # (i) the envelope is the state for all kinds, the sample peak
+        #     kind has no attack filter state
+        if self.env is None or self.env.shape[0] != x.shape[1]:
+            self.zi  = np.zeros( (len(self.a) - 1, x.shape[1]) ) \
+                       if self.b is not None else None
+            self.env = np.full( x.shape[1], -200.0 )
+
+        # Attack integrator
+        att = np.abs(x)
+        if self.b is not None:
+            att, self.zi = signal.lfilter( self.b, self.a, att, axis=0, zi=self.zi )
+        att *= self.gain
+
+        if self.fall is None:
+            return att.max(axis=0)
+
+        # Fall back: env[n] = max_k( att[k] - fall * (n - k) ), including
+        # the previous block envelope as k = -1
+        att  = 20 * np.log10( np.maximum(att, 1e-10) )
+        ramp = self.fall * np.arange( 1, len(att) + 1 )[:, np.newaxis]
+        env  = np.maximum.accumulate( att + ramp, axis=0 )
+        env  = np.maximum( env, self.env ) - ramp
+        self.env = env[-1]
+
+        return 10 ** ( env.max(axis=0) / 20 )
+
+
+# IEC 61672 frequency weightings, the analog poles in Hz
+# (all zeros at 0 Hz, 4 for A and 2 for C)
+WEIGHTINGS = {
+    'A':    {'zeros': 4, 'poles': (20.598997, 20.598997, 107.65265, 737.86223,
+                                   12194.217, 12194.217)},
+    'C':    {'zeros': 2, 'poles': (20.598997, 20.598997, 12194.217, 12194.217)},
+    'Z':    None
+}
+
+
+def weighting_sos(fs, curve='A'):
+    """ The 'A', 'C' or 'Z' frequency weighting filter as per IEC 61672,
+        as SOS for scipy.signal.sosfilt, 0 dB at 1 KHz.
+
+        The digital filter is the bilinear transform of the analog one,
+        with the poles prewarped to keep the high frequencies response
+        within IEC 61672 class 1 tolerances at 44.1 and 48 KHz.
+
+        It is designed once per fs and curve (lru_cache), so that changing
+        devices does not design it again.
+    """
+    if curve not in WEIGHTINGS:
+        raise ValueError(f'bad weighting \'{curve}\', use one of {tuple(WEIGHTINGS)}')
+    return _weighting_sos_cached(float(fs), curve).copy()
+
+
+@lru_cache(maxsize=32)
+def _weighting_sos_cached(fs, curve):
+
+    if WEIGHTINGS[curve] is None:
+        # Z: a flat section
+        return np.array( [[1.0, 0.0, 0.0, 1.0, 0.0, 0.0]] )
+
+    z = np.zeros( WEIGHTINGS[curve]['zeros'] )
+    f = np.array( WEIGHTINGS[curve]['poles'] )
+    p = -2 * fs * np.tan( np.pi * f / fs )
+    zd, pd, kd = signal.bilinear_zpk(z, p, 1.0, fs)
+    sos = signal.zpk2sos(zd, pd, kd)
+
+    # 0 dB at 1 KHz
+    _, h = signal.sosfreqz(sos, worN=[1000.0], fs=fs)
+    sos[0, :3] /= np.abs(h[0])
 
+    return sos
 
-        .start()        Start to measure
+
+# Sound level meter time weightings (seconds)
+TIME_WEIGHTINGS = {'fast': 0.125, 'slow': 1.0}
+
+
+class SoundLevel(object):
+    """
+        Sound level meter as per IEC 61672: a frequency weighting (see
+        weighting_sos), then the Fast and Slow exponential time weightings
+        and the Leq of the squared signal.
+
+        All channels are processed at once, the filters states and the Leq
+        energy are kept from one block to the next one.
+
+        sl = SoundLevel(fs, weighting='A', cal=0.0)
+
+        F, S, Leq = sl(x)   x: audio block x[:, channel]
+                            F, S, Leq: levels of each channel
+                            at the end of the block
+
+        .cal            Calibration offset in dB, so that the levels are
+                        dB SPL: the known SPL of a calibrator minus its
+                        reading with cal=0 (10*log10 of the mean square,
+                        dBFS)
+
+        .reset()        Reset the filters and the Leq
+    """
+
+
+    def __init__(self, fs, weighting='A', cal=0.0):
+
+        self.weighting  = weighting
+        self.cal        = cal
+        self.sos        = weighting_sos(fs, weighting)
+
+        # Fast and Slow one pole integrators
+        self.p = np.array( [ np.exp( -1 / (fs * TIME_WEIGHTINGS[tw]) )
+                             for tw in ('fast', 'slow') ] )
+
+        self.reset()
+
+
+    def reset(self):
+        self.zi     = None
+        self.ms     = None
+        self.energy = 0.0
+        self.n      = 0
+
+
+    def _dB(self, ms):
+        return 10 * np.log10( np.maximum(ms, 1e-20) ) + self.cal
+
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype='float64')
+        if x.ndim == 1:
+            x = x.reshape(-1, 1)
+        if self.zi is None or self.zi.shape[2] != x.shape[1]:
+            self.zi     = np.zeros( (len(self.sos), 2, x.shape[1]) )
+            self.ms     = np.zeros( (2, x.shape[1]) )
+            self.energy = np.zeros( x.shape[1] )
+            self.n      = 0
+
+        y, self.zi = signal.sosfilt( self.sos, x, axis=0, zi=self.zi )
+        sq = np.square(y)
+
+        # Fast and Slow time weighting, their states are the last values:
+        # y[n] = p y[n-1] + (1 - p) x[n]
+        for i, p in enumerate(self.p):
+            zi = (p * self.ms[i])[np.newaxis, :]
+            self.ms[i] = signal.lfilter( [1 - p], [1, -p], sq, axis=0, zi=zi )[0][-1]
+
+        # Leq since the start or last reset
+        self.energy += np.sum(sq, axis=0)
+        self.n      += len(sq)
+
+        return self._dB(self.ms[0]), self._dB(self.ms[1]), \
+               self._dB(self.energy / self.n)
+
+
+class RTA(object):
+    """
+        Real time analyzer on iso R series fractional octave bands
+        (see iso_R.py).
+
+        Each audio block is Hann windowed, then the FFT power bins are summed
+        into the bands by a precomputed sparse aggregation matrix. A bin
+        crossing a band edge contributes to both bands in proportion, so
+        the low bands narrower than a bin are not empty.
+
+        The band powers are scaled as mean squares, so that the sum of all
+        bands is the signal power, e.g. a sine of amplitude A gives A**2 / 2
+        in its band.
+
+        rta = RTA(fs, N, serie='1/3', fmin=20, tau=0.0)
+
+        P = rta(x)      x: audio block x[:, channel] of N samples
+                        P: band powers P[band, channel]
+
+        .freqs          The bands center frequencies
+
+        .edges          The bands edges, len(freqs) + 1
+
+        .tau            Exponential averaging time constant in seconds,
+                        0 for no averaging
+
+        .reset()        Reset the averaging
+    """
+
+
+    def __init__(self, fs, N, serie='1/3', fmin=20, tau=0.0):
+
+        self.fs     = fs
+        self.N      = N
+        self.tau    = tau
+        self.freqs  = get_iso_R(serie, fs=fs, fmin=fmin)
+
+        # Band edges: geometric mean between centers,
+        # half a band at both ends
+        bands_per_decade = {'R10': 10, 'R20': 20, 'R40': 40, 'R80': 80,
+                            '1/3': 10, '1/6': 20, '1/12': 40, '1/24': 80}[serie]
+        half = 10 ** (1 / (2 * bands_per_decade))
+        f = self.freqs
+        self.edges = np.concatenate( ( [f[0] / half],
+                                       np.sqrt(f[:-1] * f[1:]),
+                                       [f[-1] * half] ) )
+
+        # Aggregation matrix: the overlap of each bin [f - df/2, f + df/2]
+        # with each band, as a fraction of the bin width
+        df = fs / N
+        fbins = np.fft.rfftfreq(N, 1 / fs)
+        lo = np.maximum( fbins - df / 2, 0 )
+        hi = fbins + df / 2
+        rows, cols, vals = [], [], []
+        for b in range(len(f)):
+            k = np.flatnonzero( (hi > self.edges[b]) & (lo < self.edges[b + 1]) )
+            overlap = ( np.minimum(hi[k], self.edges[b + 1]) -
+                        np.maximum(lo[k], self.edges[b]) ) / df
+            rows.append( np.full(len(k), b) )
+            cols.append( k )
+            vals.append( overlap )
+        self.agg = sparse.csr_matrix( ( np.concatenate(vals),
+                                        ( np.concatenate(rows),
+                                          np.concatenate(cols) ) ),
+                                      shape=(len(f), len(fbins)) )
+
+        # Hann window and the scale of the one sided power spectrum,
+        # as mean square of the signal (Parseval)
+        self.window = signal.windows.hann(N, sym=False)
+        self.scale  = np.full( len(fbins), 2 / (N * np.sum(self.window ** 2)) )
+        self.scale[0] /= 2
+        if N % 2 == 0:
+            self.scale[-1] /= 2
+
+        # Exponential averaging coefficient for blocks of N samples
+        self.alpha = np.exp( -N / (fs * tau) ) if tau else 0.0
+
+        self.reset()
+
+
+    def reset(self):
+        self.P = None
+
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype='float64')
+        if x.ndim == 1:
+            x = x.reshape(-1, 1)
+
+        X = np.fft.rfft( x * self.window[:, np.newaxis], axis=0 )
+        P = self.agg @ ( ( np.square(X.real) + np.square(X.imag) )
+                         * self.scale[:, np.newaxis] )
+
+        if self.alpha and self.P is not None and self.P.shape == P.shape:
+            self.P = self.alpha * self.P + (1 - self.alpha) * P
+        else:
+            self.P = P
+
+        return self.P
+
+
+class StreamMeter(object):
+    """
+        Base class for the meters of an audio stream from a system sound
+        device, captured in blocks of 100 ms.
+
+        .start()        Start to measure in a thread, until .stop()
+
+        .stop()         Stop measuring, the thread or the .frames() iterator
+
+        .frames()       An asyncio iterator of measurement frames:
+
+                            async for frame in meter.frames():
+                                ...
+
+                        The values are accumulated inside the audio callback,
+                        then every block is measured in the event loop as soon
+                        as it arrives, so no thread is needed. All blocks are
+                        measured even if the consumer is slow, but only the
+                        latest frame is yielded, stale frames are skipped.
 
         .device         The sound device identifier (see -l command line option)
 
-        .mode           'rms' or 'peak'
+        .channels       Number of channels
 
-        .bar            (boolean) On console use, will display a meter bar
+        .callback_metering  If True, the per channel values are accumulated
+                            inside the audio callback, then handed off to the
+                            metering thread through .handoff. Otherwise the
+                            raw audio blocks are queued.
+
+        .handoff        The SPSCRing of per channel values, see its .depth,
+                        .max_depth and .overruns counters
+
+        Subclasses provide:
+
+        ._setup()           Prepare the processing state for a new stream
 
-        .L              The measured level
+        ._values_shape()    If the values are not one per channel
 
+        ._accumulate(block) The per channel values of an audio block
+
+        ._measure(values)   Update the measurements from the per channel
+                            values, returns the measurement frame (a dict)
     """
 
 
-    def __init__(self, device, mode='rms', bar=True):
-        self.device = device
-        self.mode   = mode
-        self.bar    = bar
-        self.L      = -100.0
+    # Audio block duration in seconds
+    BLOCK_DUR   = 0.100
+    # The metering thread checks for .stop() at least at this interval
+    TIMEOUT     = 0.5
+
+
+    def __init__(self, device, channels=2, callback_metering=False,
+                 ring_slots=32):
+        self.device     = device
+        self.channels   = channels
+        self.callback_metering = callback_metering
+        self.ring_slots = ring_slots
+        self.handoff    = None
+        self._stop      = threading.Event()
+        self._thread    = None
+        self._wake      = None
+        # The .frames() new frame event and the latest frame
+        self._new       = None
+        self._latest    = None
+        # An optional preallocated array to read the handoff values into
+        self._out       = None
+
+
+    def _prepare(self):
+
+        if sd is None:
+            raise RuntimeError('sounddevice is needed to measure a sound device')
+
+        # Getting current Fs
+        self.fs = sd.query_devices(self.device, 'input')['default_samplerate']
+
+        # lenght in samples of the audio block
+        self.bs = int( self.fs * self.BLOCK_DUR )
+
+        self._stop.clear()
+        self._setup()
+
+        # Prepare an internal FIFO queue for the callback function,
+        # or a preallocated ring for the per channel values
+        self._qIn    = queue.Queue()
+        self.handoff = SPSCRing( self.ring_slots, self._values_shape() )
+
+
+    def _values_shape(self):
+        """ The shape of the values from ._accumulate() """
+        return self.channels
+
+
+    def _stream(self, callback):
+
+        return sd.InputStream(  device=self.device,
+                                callback=callback,
+                                blocksize=self.bs,
+                                samplerate=self.fs,
+                                channels= self.channels,
+                                dither_off=True)
 
 
     def start(self):
-        """ Starts metering forever """
+        """ Starts metering in a thread, until .stop() """
+
+        self._prepare()
 
         def callback(indata, frames, time, status):
-            """ The handler for input stream audio chunks """
+            """ The handler for input stream audio chunks, puts data into
+                the input-queue, or if callback_metering hands off the
+                per channel values to the metering thread
+            """
             if status:
                 print( f'----- {status} -----' )
-            qIn.put( indata )
-
-
-        def measure(block, duration, mode):
-            """ Compute the measured level for each audio block"""
-            if mode == 'rms':
-                # Mean square calculation for audio blocks
-                msqL = np.sum( np.square( block[:,0] ) ) / (fs * dur)
-                msqR = np.sum( np.square( block[:,1] ) ) / (fs * dur)
-                # Combine 2 channels
-                if msqL or msqR:    # avoid log10(0+0)
-                    M = 20 * np.log10(msqL + msqR) / 2
-                else:
-                    M = -100.0
-
-            elif mode == 'peak':
-                ML, MR = np.max(block[:,0]), np.max(block[:,1])
-                M = max(ML, MR)
-                if M:
-                    M = 20 * np.log10(M)
-                else:
-                    M = -100.0
-
+            if self.callback_metering:
+                self.handoff.push( self._accumulate(indata) )
             else:
-                print('bad mode')
-                sys.exit()
+                # (i) indata buffer is reused by sounddevice, so a copy is needed
+                self._qIn.put( indata.copy() )
 
-            return round(M, 1)
 
-
-        def loop_forever():
+        def loop():
             """ loop capturing stream and processing audio blocks """
 
-            with sd.InputStream(  device=self.device,
-                                  callback=callback,
-                                  blocksize=bs,
-                                  samplerate=fs,
-                                  channels= 2,
-                                  dither_off=True):
-                while True:
-                    # Reading captured (b)locks:
-                    b = qIn.get()
-                    # Compute the measured level
-                    self.L = measure(block=b, duration=dur, mode=self.mode)
-                    # Print a nice bar meter
-                    if self.bar:
-                        I = max(-60, int(self.L))
-                        print( f' {"#" * (60 + I + 1)}{" " * (-I - 1)}  {self.L}',
-                               end='\r')
-
-
-        h1 = f'-60       -50       -40       -30       -20       -10        0' + \
-             f'  {self.mode.upper()}'
+            with self._stream(callback):
+
+                while not self._stop.is_set():
+
+                    if self.callback_metering:
+                        # already accumulated in the audio callback
+                        values = self.handoff.get(timeout=self.TIMEOUT,
+                                                  out=self._out)
+                        if values is None:
+                            continue
+                    else:
+                        # Reading captured blocks
+                        try:
+                            block = self._qIn.get(timeout=self.TIMEOUT)
+                        except queue.Empty:
+                            continue
+                        values = self._accumulate(block)
+
+                    self._measure(values)
+
+
+        # Launch a thread that loops metering audio blocks
+        self._thread = threading.Thread( target=loop, args=() )
+        self._thread.start()
+
+
+    def stop(self):
+        """ Stops metering """
+
+        self._stop.set()
+
+        # wakes up a waiting .frames() iterator
+        if self._wake:
+            try:
+                self._wake()
+            except RuntimeError:
+                # the event loop is closed
+                pass
+
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+
+    def _drain(self):
+        """ Measures all the pending blocks in the event loop, whether the
+            .frames() consumer is waiting or not, keeps the latest frame
+        """
+        if self._new is None:
+            # the iterator is finished
+            return
+
+        frame = None
+        while True:
+            values = self.handoff.pop(self._out)
+            if values is None:
+                break
+            frame = self._measure(values)
+
+        if frame is not None:
+            self._latest = frame
+            self._new.set()
+
+
+    async def frames(self):
+        """ An asyncio iterator of measurement frames (see the class doc) """
+
+        self._prepare()
+
+        loop            = asyncio.get_running_loop()
+        new             = asyncio.Event()
+        self._new       = new
+        self._latest    = None
+        self._wake      = lambda: loop.call_soon_threadsafe(new.set)
+
+        def callback(indata, frames, time, status):
+            """ The handler for input stream audio chunks, hands off
+                the per channel values to the event loop to be measured
+            """
+            if status:
+                print( f'----- {status} -----' )
+            self.handoff.push( self._accumulate(indata) )
+            try:
+                loop.call_soon_threadsafe(self._drain)
+            except RuntimeError:
+                # the event loop is closed
+                pass
+
+        try:
+            with self._stream(callback):
+
+                while not self._stop.is_set():
+
+                    await new.wait()
+                    new.clear()
+
+                    # Only the latest frame, the stale ones are skipped
+                    frame, self._latest = self._latest, None
+                    if frame is not None and not self._stop.is_set():
+                        yield frame
+
+        finally:
+            # (i) a generator left by a 'break' is finalized later on,
+            #     maybe when a new one is running
+            if self._new is new:
+                self._wake      = None
+                self._new       = None
+                self._latest    = None
+
+
+class Meter(StreamMeter):
+    """
+        Measures the signal level of an audio stream from a system sound device.
+        (see StreamMeter for the common methods and attributes)
+
+        .mode           'rms', 'peak', 'truepeak' or 'rta', or a ballistics
+                        'vu', 'ppm1', 'ppm2', 'ebu' (see Ballistics),
+                        or 'spl' (see SoundLevel)
+
+        .channels       Number of channels, the level is the rms power
+                        of all channels, or the max peak of them
+
+        .serie          'rta' mode iso R serie: '1/3', '1/6', '1/12', '1/24'
+
+        .tau            'rta' mode averaging time constant in seconds
+
+        .bands          'rta' mode bands level, the bands center frequencies
+                        are .rta.freqs (see RTA)
+
+        .weighting      'spl' mode frequency weighting: 'A', 'C' or 'Z'
+
+        .integration    'spl' mode time weighting: 'fast', 'slow' or 'leq'
+
+        .cal            'spl' mode calibration offset in dB, the level
+                        is in dB SPL (the max of all channels)
+
+        .bar            (boolean) On console use, will display a meter bar
+
+        .L              The measured level, the frames are {'L': level},
+                        plus 'bands' in 'rta' mode
+
+    """
+
+
+    MODES = ('rms', 'peak', 'truepeak', 'rta', 'spl') + tuple(BALLISTICS)
+
+    INTEGRATIONS = ('fast', 'slow', 'leq')
+
+
+    def __init__(self, device, mode='rms', bar=True,
+                 callback_metering=False, ring_slots=32, channels=2,
+                 serie='1/3', tau=0.0,
+                 weighting='A', integration='fast', cal=0.0):
+        if mode not in self.MODES:
+            raise ValueError(f'bad mode \'{mode}\', use one of {self.MODES}')
+        if integration not in self.INTEGRATIONS:
+            raise ValueError(f'bad integration \'{integration}\', '
+                             f'use one of {self.INTEGRATIONS}')
+        super().__init__(device, channels=channels,
+                         callback_metering=callback_metering,
+                         ring_slots=ring_slots)
+        self.mode   = mode
+        self.bar    = bar
+        self.L      = -100.0
+        self.serie  = serie
+        self.tau    = tau
+        self.rta    = None
+        self.bands  = None
+        self.weighting   = weighting
+        self.integration = integration
+        self.cal    = cal
+
+
+    def _setup(self):
+
+        # The true peak oversampling filter keeps its state along blocks
+        self._tp = TruePeak()
+
+        # The bands analyzer keeps the averaged band powers along blocks
+        if self.mode == 'rta':
+            self.rta = RTA(self.fs, self.bs, serie=self.serie, tau=self.tau)
+
+        # The meter ballistics keep their envelopes along blocks
+        if self.mode in BALLISTICS:
+            self._ballistics = Ballistics(self.fs, self.mode)
+
+        # The sound level meter, the weighting filter is designed once per fs
+        if self.mode == 'spl':
+            self._spl = SoundLevel(self.fs, self.weighting, self.cal)
+
+        # The bar scale from -60 to 0 dBFS, or from 60 to 120 dB SPL
+        self._bar_offset = 120 if self.mode == 'spl' else 0
+        h1 = [' '] * 63
+        for i, v in enumerate( range(-60, 1, 10) ):
+            v = str(v + self._bar_offset)
+            h1[ 1 + 10 * i - len(v) // 2 : 1 + 10 * i - len(v) // 2 + len(v) ] = v
+        h1 = ''.join(h1).rstrip() + f'  {self.mode.upper()}'
+        if self.mode == 'spl':
+            h1 += f' dB({self.weighting}) {self.integration}'
         h2 =  ' |    |    |    |    |    |    |    |    |    |    |    |    |'
         if self.bar:
             print(h1)
             print(h2)
 
-        # Prepare an internal FIFO queue for the callback function
-        qIn    = queue.Queue()
 
-        # Getting current Fs
-        fs = sd.query_devices(self.device, 'input')['default_samplerate']
+    def _accumulate(self, block):
+        """ The per channel values of an audio block:
+            mean square, peak or true peak
+        """
+        if self.mode == 'rms':
+            return np.mean( np.square(block), axis=0 )
 
-        # Audio block duration in seconds
-        dur = 0.100
-        # lenght in samples of the audio block
-        bs  = int( fs * dur )
+        elif self.mode == 'peak':
+            # negative peaks count too
+            return np.max( np.abs(block), axis=0 )
 
-        # Launch a thread that loops metering audio blocks
-        jloop = threading.Thread( target=loop_forever, args=() )
-        jloop.start()
+        elif self.mode == 'rta':
+            # band powers, all channels combined
+            return np.sum( self.rta(block), axis=1 )
+
+        elif self.mode in BALLISTICS:
+            # VU or PPM readings
+            return self._ballistics(block)
+
+        elif self.mode == 'spl':
+            # Fast, Slow or Leq levels
+            F, S, Leq = self._spl(block)
+            return {'fast': F, 'slow': S, 'leq': Leq}[self.integration]
+
+        else:
+            # inter sample peaks from the 4x oversampled signal
+            return self._tp(block)
+
+
+    def _values_shape(self):
+        if self.mode == 'rta':
+            return len(self.rta.freqs)
+        return self.channels
+
+
+    def _measure(self, values):
+        """ Compute the measured level from the per channel values """
+
+        if self.mode == 'rta':
+            # bands power in dB, -100 for silent bands
+            self.bands = np.round( 10 * np.log10( np.maximum(values, 1e-10) ), 1 )
+
+        if self.mode == 'spl':
+            # already in dB SPL
+            L = np.max(values)
+
+        elif self.mode in ('rms', 'rta'):
+            # Combine channels power
+            L = np.sum(values)
+            if L:               # avoid log10(0)
+                L = 10 * np.log10(L)
+            else:
+                L = -100.0
+
+        else:
+            L = np.max(values)
+            if L:
+                L = 20 * np.log10(L)
+            else:
+                L = -100.0
+
+        self.L = round(float(L), 1)
+
+        # Print a nice bar meter
+        if self.bar:
+            I = max(-60, int(self.L - self._bar_offset))
+            print( f' {"#" * (60 + I + 1)}{" " * (-I - 1)}  {self.L}',
+                   end='\r')
+
+        if self.mode == 'rta':
+            return {'L': self.L, 'bands': self.bands.tolist()}
+
+        return {'L': self.L}
 
 
 if __name__ == '__main__':
@@ -175,7 +916,11 @@ if __name__ == '__main__':
     args = parse_cmdline()
 
     # Prepare a meter instance
-    meter = Meter(device=args.input_device, mode=args.mode, bar=True)
+    meter = Meter( device=args.input_device, mode=args.mode, bar=True,
+                   callback_metering=args.callback_metering,
+                   channels=args.channels, serie=args.serie, tau=args.tau,
+                   weighting=args.weighting, integration=args.integration,
+                   cal=args.calibration )
 
     # Do start metering
     meter.start()
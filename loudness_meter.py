@@ -17,109 +17,33 @@
 # along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
 
 """
-    Measures EBU R128 [M]omentary & [I]ntegrated loudness of
-    an audio stream from a system sound device.
+    Measures EBU R128 [M]omentary, [S]hort term & [I]ntegrated loudness
+    of an audio stream from a system sound device.
 
     To view suported devices use '-l' option
 
+    Audio files can be analyzed offline by using '-f' option, then
+    [I]ntegrated loudness, Loudness Range [LRA], the max [M]omentary
+    and [S]hort term loudness and the True Peak [TP] are given.
+    Raw .pcm files are float32, use '-fs' and '-ch' to describe them.
+
 """
 import sys
 import os
 import argparse
 import numpy as np
-from scipy.signal import lfilter, lfilter_zi
-import queue
+from scipy.signal import sosfilt
 import threading
+import time
 # Thanks to https://python-sounddevice.readthedocs.io
-import sounddevice as sd
-
-
-def biquad(fs, f0, Q, ftype, dBgain=0.0):
-    """
-    INPUTS:
-
-        fs:         sampling rate
-        f0:         filter central frequency
-        Q:          quality factor as per "peakingEQ" at "DSP EQ cookbook",
-                    stands for the BW from -6 dB points arounf f0.
-        ftype:      lpf, hpf, notch, peakingEQ, lowshelf, highshelf (string)
-        dBgain:     used for peakingEQ, lowshelf, highshelf kind of filters.
-
-    OUTPUT:
-
-        (b,a):      coeffs of the IIR filter associated to a biquad
-
-    CREDITS:
-        #############################################################
-        ###  http://www.musicdsp.org/files/Audio-EQ-Cookbook.txt  ###
-        #############################################################
-    """
-
-    if (Q <= 0):
-        raise ValueError("Q must be positive");
-
-    if (f0 <= 0) or (fs <= 0):
-        raise ValueError("f must be positive");
-
-
-    A     = np.sqrt(10 ** (dBgain / 20.0))
-    w0    = 2.0 * np.pi * f0 / fs
-    alpha = np.sin(w0) / (2.0 * Q)
-
-    if ftype.lower() == "lpf":
-        b0 =  (1 - np.cos(w0)) / 2
-        b1 =   1 - np.cos(w0)
-        b2 =  (1 - np.cos(w0)) / 2
-        a0 =   1 + alpha
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha
-
-    elif ftype.lower() == "hpf":
-        b0 =  (1 + np.cos(w0)) / 2
-        b1 = -(1 + np.cos(w0))
-        b2 =  (1 + np.cos(w0)) / 2
-        a0 =   1 + alpha
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha
-
-    elif ftype.lower() == "notch":
-        b0 =   1
-        b1 =  -2 * np.cos(w0)
-        b2 =   1
-        a0 =   1 + alpha
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha
-
-    elif ftype.lower() == "peakingeq":
-        b0 =   1 + alpha * A
-        b1 =  -2 * np.cos(w0)
-        b2 =   1 - alpha * A
-        a0 =   1 + alpha / A
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha / A
-
-    elif ftype.lower() == "lowshelf":
-        b0 =      A * ( (A+1) - (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha )
-        b1 =  2 * A * ( (A-1) - (A+1)*np.cos(w0)                      )
-        b2 =      A * ( (A+1) - (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha )
-        a0 =            (A+1) + (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha
-        a1 = -2 *     ( (A-1) + (A+1)*np.cos(w0)                      )
-        a2 =            (A+1) + (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha
-
-    elif ftype.lower() == "highshelf":
-        b0 =      A * ( (A+1) + (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha )
-        b1 = -2 * A * ( (A-1) + (A+1)*np.cos(w0)                      )
-        b2 =      A * ( (A+1) + (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha )
-        a0 =            (A+1) - (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha
-        a1 =  2 *     ( (A-1) - (A+1)*np.cos(w0)                      )
-        a2 =            (A+1) - (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha
-
-    else:
-        raise ValueError("Wrong biquad type")
-
-    a = np.array([a0, a1, a2])
-    b = np.array([b0, b1, b2])
-    return b, a
+# (i) not needed when analyzing files
+try:
+    import sounddevice as sd
+except Exception:
+    sd = None
+from tools import readWAV_raw, readPCM, pcm2float
+from level_meter import TruePeak, StreamMeter
+from meter_publisher import MeterPublisher, SHM_NAME, LU_FIELDS
 
 
 def parse_cmdline():
@@ -140,32 +64,486 @@ def parse_cmdline():
     parser.add_argument('-id', '--input_device', type=int_or_str,
             help='input device (numeric ID or substring, see -l)')
 
+    parser.add_argument('-f', '--file', nargs='+',
+            help='analyze audio files (.wav or float32 .pcm) then exit')
+
+    parser.add_argument('-fs', '--samplerate', type=int, default=44100,
+            help='sample rate for .pcm files (default: 44100)')
+
+    parser.add_argument('-ch', '--channels', type=int, default=2,
+            help='channels to measure, also for .pcm files (default: 2)')
+
+    parser.add_argument('-pub', '--publish', action='store_true',
+            help=f'publish measurements to shared memory \'{SHM_NAME}\'')
+
+    parser.add_argument('-sock', '--socket', type=str,
+            help='also publish measurements to clients of this UNIX socket')
+
+    parser.add_argument('-fmt', '--format', type=str, default='bin',
+            help='\'bin\' or \'json\' socket frames (default: bin)')
+
+    parser.add_argument('-w', '--weights', type=str,
+            help='comma separated channel weights '
+                 '(default: BS.1770 weights for the channel layout)')
+
+    parser.add_argument('-cb', '--callback_metering', action='store_true',
+            help='K filtering inside the audio callback')
+
     args = parser.parse_args()
 
     if args.list_devices:
+        if sd is None:
+            parser.exit(1, 'sounddevice is not available\n')
         print(sd.query_devices())
         parser.exit(0)
 
+    if args.weights:
+        try:
+            args.weights = [ float(w) for w in args.weights.split(',') ]
+        except ValueError:
+            parser.error(f'bad channel weights \'{args.weights}\'')
+        # (i) .wav files have their own channels, checked when analyzed
+        wav_files = args.file and all( f.lower().endswith('.wav') for f in args.file )
+        if not wav_files and len(args.weights) != args.channels:
+            parser.error(f'{len(args.weights)} channel weights given '
+                         f'for {args.channels} channels (see -ch)')
+
     return args
 
 
-class LU_meter(object):
+def k_weighting_sos(fs):
+    """ The 'K' weighting filter as per ITU-R BS.1770, a High Shelf ~ +4dB
+        above ~1.5KHz followed by a ~38Hz HPF, as a 2 sections SOS.
+
+        The filters are derived for the given fs from their analog
+        prototypes, this gives exactly the BS.1770 coefficients at 48 KHz.
+        (see the libebur128 implementation)
+    """
+    # Stage 1: high shelf
+    f0 = 1681.974450955533
+    G  = 3.999843853973347
+    Q  = 0.7071752369554196
+    K  = np.tan(np.pi * f0 / fs)
+    Vh = 10 ** (G / 20.0)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1.0 + K / Q + K * K
+    shelf = [ (Vh + Vb * K / Q + K * K) / a0,
+              2.0 * (K * K - Vh) / a0,
+              (Vh - Vb * K / Q + K * K) / a0,
+              1.0,
+              2.0 * (K * K - 1.0) / a0,
+              (1.0 - K / Q + K * K) / a0 ]
+
+    # Stage 2: HPF (RLB weighting)
+    f0 = 38.13547087602444
+    Q  = 0.5003270373238773
+    K  = np.tan(np.pi * f0 / fs)
+    a0 = 1.0 + K / Q + K * K
+    hpf = [ 1.0, -2.0, 1.0,
+            1.0,
+            2.0 * (K * K - 1.0) / a0,
+            (1.0 - K / Q + K * K) / a0 ]
+
+    return np.array( [shelf, hpf] )
+
+
+# BS.1770 channel weights for the usual layouts, in WAV / SMPTE channel order:
+# surround channels at +1.5 dB, LFE excluded.
+CHANNEL_WEIGHTS = {
+    1: (1.0,),                                          # M
+    2: (1.0, 1.0),                                      # L R
+    3: (1.0, 1.0, 1.0),                                 # L R C
+    4: (1.0, 1.0, 1.41, 1.41),                          # L R Ls Rs
+    5: (1.0, 1.0, 1.0, 1.41, 1.41),                     # L R C Ls Rs
+    6: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41),                # 5.1
+    8: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41, 1.41)     # 7.1
+}
+
+
+def channel_weights(channels, weights=None):
+    """ The BS.1770 channel weights as an array, for the given number of
+        channels (see CHANNEL_WEIGHTS, other layouts are weighted 1.0),
+        or the given custom weights.
+    """
+    if weights is None:
+        weights = CHANNEL_WEIGHTS.get(channels, (1.0,) * channels)
+
+    weights = np.array(weights, dtype='float64')
+
+    if weights.shape != (channels,):
+        raise ValueError(f'{len(weights)} weights given for {channels} channels')
+
+    return weights
+
+
+class K_filter(object):
+    """
+        'K' weighting filter as per ITU-R BS.1770 (see k_weighting_sos)
+
+        The filter state is kept from one block to the next one, so that
+        filtering a stream by blocks gives the same as filtering it at once.
+
+        k = K_filter(fs)
+
+        y = k(x)        x, y: audio blocks x[:, channel]
+
+        .reset()        Reset the filter state
+    """
+
+
+    def __init__(self, fs):
+        self.sos = k_weighting_sos(fs)
+        # State (sections, 2, channels), will be shaped on the first block
+        self.zi = None
+
+
+    def reset(self):
+        self.zi = None
+
+
+    def __call__(self, x):
+        # The filter starts at rest
+        if self.zi is None or self.zi.shape[2] != x.shape[1]:
+            self.zi = np.zeros( (self.sos.shape[0], 2, x.shape[1]) )
+        # all channels at once
+        y, self.zi = sosfilt( self.sos, x, axis=0, zi=self.zi )
+        return y
+
+
+class BlockRing(object):
+    """
+        A ring buffer of the mean square energies of the last 100 ms blocks,
+        with running sums for sliding windows of several blocks length,
+        e.g. 4 blocks (400 ms, momentary) and 30 blocks (3 s, short term).
+
+        Each new block updates the sums in O(1), regardless of the
+        sample rate and the windows length.
+
+        r = BlockRing( lengths=(4, 30) )
+
+        .push(z)        Adds a new block energy
+
+        .mean(n)        The mean energy along the last n blocks window
+                        (n must be one of lengths)
+
+        .count          Blocks pushed since the last reset
+    """
+
+
+    # Running sums are recalculated from scratch after this number of
+    # blocks, to get rid of the accumulated float rounding errors.
+    RESUM_BLOCKS = 3000
+
+
+    def __init__(self, lengths=(4, 30)):
+        self.lengths = tuple(lengths)
+        self.size    = max(lengths)
+        self.reset()
+
+
+    def reset(self):
+        # (i) A list is faster than a numpy array for scalar access
+        self.ring  = [0.0] * self.size
+        self.pos   = 0
+        self.count = 0
+        self.sums  = { n: 0.0 for n in self.lengths }
+
+
+    def push(self, z):
+        z = float(z)
+        # The block leaving each window is the one n positions behind
+        for n in self.lengths:
+            self.sums[n] += z - self.ring[ (self.pos - n) % self.size ]
+        self.ring[self.pos] = z
+        self.pos = (self.pos + 1) % self.size
+        self.count += 1
+
+        if self.count % self.RESUM_BLOCKS == 0:
+            for n in self.lengths:
+                self.sums[n] = sum( self.ring[ (self.pos - i) % self.size ]
+                                    for i in range(1, n + 1) )
+
+
+    def mean(self, n):
+        # (i) rounding errors could give a tiny negative value
+        return max(self.sums[n], 0.0) / n
+
+
+def loudness(z):
+    """ Loudness from a mean square energy (or an array of them),
+        -100.0 for no energy
+    """
+    z = np.asarray(z, dtype=float)
+    with np.errstate(divide='ignore'):
+        L = -0.691 + 10 * np.log10(z)
+    return np.where(z > 0, L, -100.0)
+
+
+def windowed_mean(e, n):
+    """ The means of every n consecutive values of e
     """
-        Measures EBU R128 [M]omentary & [I]ntegrated loudness of
-        an audio stream from a system sound device.
+    c = np.cumsum( np.concatenate( ([0.0], e) ) )
+    return (c[n:] - c[:-n]) / n
 
 
-        .start()        Start to measure
+class LoudnessHistogram(object):
+    """
+        A fixed resolution histogram of the loudness of gating blocks,
+        for the BS.1770 gated Integrated loudness and the EBU Tech 3342
+        Loudness Range.
+
+        Each bin keeps the number of blocks and the sum of their energies,
+        so the gated mean energies are exact, only the relative gate
+        decision is quantized to the bin resolution (0.01 LU).
+        Memory is O(bins) whatever the session length.
+
+        Blocks not above the -70 LUFS absolute gate are not counted.
+
+        h = LoudnessHistogram()
+
+        .add(z)             Adds a block mean square energy, O(1)
+
+        .add_many(z)        Adds an array of block energies
+
+        .integrated()       Gated loudness (LUFS), relative gate at -10 LU,
+                            for 400 ms blocks this is the Integrated loudness
+
+        .lra()              Loudness Range (LU), relative gate at -20 LU,
+                            to be used with 3 s blocks
+
+        .snapshot()         A copy of the histogram
+
+        .merge(h2)          Adds the blocks from another histogram
+
+        .reset()            Clears the histogram
+    """
+
+
+    LMIN = -70.0    # the absolute gate
+    LMAX = +30.0    # louder blocks go to the last bin
+    RES  =  0.01    # LU
+
+
+    def __init__(self):
+        self.nbins = int( round( (self.LMAX - self.LMIN) / self.RES ) )
+        self.reset()
+
+
+    def reset(self):
+        self.counts = np.zeros(self.nbins, dtype='int64')
+        self.energy = np.zeros(self.nbins)
+
+
+    def add(self, z):
+        if z <= 0:
+            return
+        L = -0.691 + 10 * np.log10(z)
+        # absolute gate
+        if L <= self.LMIN:
+            return
+        i = min( int( (L - self.LMIN) / self.RES ), self.nbins - 1 )
+        self.counts[i] += 1
+        self.energy[i] += z
+
+
+    def add_many(self, z):
+        z = np.asarray(z, dtype=float)
+        L = loudness(z)
+        # absolute gate
+        z = z[ L > self.LMIN ]
+        L = L[ L > self.LMIN ]
+        i = np.minimum( ( (L - self.LMIN) / self.RES ).astype(int), self.nbins - 1 )
+        self.counts += np.bincount(i, minlength=self.nbins)
+        self.energy += np.bincount(i, weights=z, minlength=self.nbins)
+
+
+    def snapshot(self):
+        h = LoudnessHistogram()
+        h.counts = self.counts.copy()
+        h.energy = self.energy.copy()
+        return h
+
+
+    def merge(self, h):
+        self.counts += h.counts
+        self.energy += h.energy
+
+
+    def _relative_gate(self, gate):
+        """ The first bin above the relative gate, or None if empty
+        """
+        n = self.counts.sum()
+        if not n:
+            return None
+        gate = float( loudness( self.energy.sum() / n ) ) + gate
+        # bins whose center is above the gate
+        return max( int( np.ceil( (gate - self.LMIN) / self.RES - 0.5 ) ), 0 )
+
+
+    def integrated(self, gate=-10.0):
+        i0 = self._relative_gate(gate)
+        if i0 is None:
+            return -100.0
+        n = self.counts[i0:].sum()
+        if not n:
+            return -100.0
+        return float( loudness( self.energy[i0:].sum() / n ) )
+
+
+    def lra(self, gate=-20.0):
+        i0 = self._relative_gate(gate)
+        if i0 is None:
+            return 0.0
+        c = np.cumsum( self.counts[i0:] )
+        if not len(c) or not c[-1]:
+            return 0.0
+        # the loudness at the 10% and 95% percentiles, as bins centers
+        # (nearest rank as in libebur128)
+        i10 = i0 + np.searchsorted( c, int( (c[-1] - 1) * 0.10 + 0.5 ), side='right' )
+        i95 = i0 + np.searchsorted( c, int( (c[-1] - 1) * 0.95 + 0.5 ), side='right' )
+        return float( (i95 - i10) * self.RES )
+
+
+def analyze_file(fname, fs=44100, channels=2, chunk_blocks=600, truepeak=True,
+                 weights=None):
+    """
+        Offline EBU R128 / BS.1770 analysis of a .wav or a raw float32 .pcm
+        audio file (fs and channels are only used for .pcm files).
+
+        The channels are weighted as per BS.1770 for the file channel layout,
+        or by the given weights (see channel_weights).
+
+        The file is memory mapped and processed in chunks of chunk_blocks
+        blocks of 100 ms, so that long files do not need to fit in memory.
+        The gating blocks go into loudness histograms, so the memory used
+        does not depend on the file length.
+
+        returns a dictionary:
+
+            'I'         Integrated loudness (LUFS)
+            'LRA'       Loudness Range (LU)
+            'M_max'     max Momentary loudness (LUFS)
+            'S_max'     max Short term loudness (LUFS)
+            'TP'        True peak (dBTP), if truepeak (see level_meter.TruePeak)
+            'duration'  seconds
+    """
+    if fname.lower().endswith('.wav'):
+        fs, raw = readWAV_raw(fname)
+    else:
+        raw = readPCM(fname)
+        raw = raw[ : len(raw) // channels * channels ].reshape(-1, channels)
+
+    # mono files
+    if raw.ndim == 1:
+        raw = raw.reshape(-1, 1)
+
+    # Block size in samples for 100 msec of audio at Fs
+    bs = int( fs * 0.100 )
+
+    k_filter = K_filter(fs)
+
+    w = channel_weights( raw.shape[1], weights )
+
+    if truepeak:
+        tp      = TruePeak()
+        TP      = 0.0
+
+    # The energy of the last 29 blocks, needed for the next chunk windows
+    tail    = np.zeros(0)
+    # The 400 ms gating blocks and the 3 s ones
+    hist400 = LoudnessHistogram()
+    hist3s  = LoudnessHistogram()
+    M_max   = -100.0
+    S_max   = -100.0
+
+    # (i) The last incomplete block, if any, is discarded
+    nblocks = len(raw) // bs
+
+    for b0 in range(0, nblocks, chunk_blocks):
+
+        b1 = min(b0 + chunk_blocks, nblocks)
+
+        x = pcm2float( raw[ b0 * bs : b1 * bs ] )
+
+        # “K” weight filtering
+        k = k_filter(x)
+
+        if truepeak:
+            TP = max( TP, float( np.max( tp(x) ) ) )
+
+        # Mean square of each channel along 100 ms blocks,
+        # weighted sum of all channels.
+        e = np.mean( np.square(k).reshape(b1 - b0, bs, -1), axis=1 ) @ w
+
+        # The sliding windows ending at this chunk blocks
+        # (the first windows need 4 or 30 blocks to be complete)
+        e = np.concatenate( (tail, e) )
+        z400 = windowed_mean(e, 4)[  max(len(tail) - 3,  0) : ]
+        z3s  = windowed_mean(e, 30)[ max(len(tail) - 29, 0) : ]
+        tail = e[-29:]
+
+        hist400.add_many(z400)
+        hist3s.add_many(z3s)
+
+        if len(z400):
+            M_max = max( M_max, float( loudness( z400.max() ) ) )
+        if len(z3s):
+            S_max = max( S_max, float( loudness( z3s.max() ) ) )
+
+    # The last incomplete block still counts for the true peak,
+    # then the oversampling filter history is flushed with zeros,
+    # so that the last samples reach its output
+    if truepeak:
+        if len(raw) > nblocks * bs:
+            x = pcm2float( raw[ nblocks * bs : ] )
+            TP = max( TP, float( np.max( tp(x) ) ) )
+        TP = max( TP, float( np.max( tp( np.zeros( (tp.K - 1, raw.shape[1]) ) ) ) ) )
+
+    # Integrated loudness (BS.1770 gating) and Loudness Range (EBU Tech 3342)
+    I   = hist400.integrated()
+    LRA = hist3s.lra()
+
+    res = {     'I':        I,
+                'LRA':      LRA,
+                'M_max':    M_max,
+                'S_max':    S_max,
+                'duration': len(raw) / fs    }
+
+    if truepeak:
+        res['TP'] = float( 20 * np.log10(TP) ) if TP else -100.0
+
+    return res
+
+
+class LU_meter(StreamMeter):
+    """
+        Measures EBU R128 [M]omentary, [S]hort term & [I]ntegrated loudness
+        of an audio stream from a system sound device.
+        (see level_meter.StreamMeter for .start(), .stop(), .frames() ...)
+
 
         .reset()        Reset current measurement
 
-        .device         The sound device identifier (see -l command line option)
+        .channels       Number of channels to measure
+
+        .weights        The channels weights (default BS.1770 weights for
+                        the channel layout, see channel_weights)
 
         .display        On console use, will display measurements (boolean)
 
-        .M              [M]omentary loudness measurement
+        .M              [M]omentary loudness measurement (400 ms)
+
+        .S              [S]hort term loudness measurement (3 s)
+
+        .I              [I]ntegrated loudness measurement (cummulated),
+                        as per BS.1770 two stage gating
 
-        .I              [I]ntegrated loudness measurement (cummulated)
+        .LRA            Loudness Range [LRA] measurement (EBU Tech 3342)
+
+                        the measurement frames are {'M':, 'S':, 'I':, 'LRA':}
+
+        .snapshot()     A copy of the loudness histograms the [I] and [LRA]
+                        measurements come from (see LoudnessHistogram)
 
         .M_event        Event object to notify the user for changes in [M]
 
@@ -175,14 +553,32 @@ class LU_meter(object):
 
         .I_threshold    Threshold in dB to trigger I_event
 
+        .callback_metering  If True, K filtering and the block energies are
+                            computed inside the audio callback.
+
+        .publisher      An optional MeterPublisher, for other processes to
+                        read [M], [S], [I] and [LRA] at block rate,
+                        it is closed on .stop() (see meter_publisher.py)
+
     """
 
 
     def __init__(self, device, display=False,
                        M_threshold = 1.0,
-                       I_threshold = 1.0 ):
-        # The sound device
-        self.device  = device
+                       I_threshold = 1.0,
+                       callback_metering = False,
+                       ring_slots = 32,
+                       channels = 2,
+                       weights = None,
+                       publisher = None ):
+        # The sound device, channels and where the audio blocks are processed
+        super().__init__(device, channels=channels,
+                         callback_metering=callback_metering,
+                         ring_slots=ring_slots)
+        # The channels BS.1770 weights
+        self.weights  = channel_weights(channels, weights)
+        # Publishing the measurements to other processes
+        self.publisher = publisher
         # Boolean for console display measurements
         self.display = display
         # Events to notify the user when M or I
@@ -197,173 +593,179 @@ class LU_meter(object):
         self.meas_reset  = False
         # Measured (M)omentary Loudness  dBFS
         self.M = -100.0
+        # Measured (S)hort term Loudness  dBFS
+        self.S = -100.0
         # Measured (I)ntegrated Loudness dBFS
         self.I = -100.0
+        # Measured Loudness Range [LRA] LU
+        self.LRA = 0.0
+        # Loudness histograms of the momentary and short term blocks
+        self.hist_M = LoudnessHistogram()
+        self.hist_S = LoudnessHistogram()
 
 
     def reset(self):
         self.meas_reset = True
 
 
-    def start(self):
-        """ Starts metering forever """
-
-
-        def display_header():
-            print(f'    -------- dBFS --------      --- dBLU @ -23dBFS ---')
-            print(f'    Momentary   Integrated      Momentary   Integrated')
-
-
-        def display_measurements():
-            # A header must be already displayed
-            M_FS = round(self.M, 1)
-            I_FS = round(self.I, 1)
-            M_LU = M_FS - -23.0        # from dBFS to dBLU ( 0 dBLU = -23dBFS )
-            I_LU = I_FS - -23.0
-            print( f'    {M_FS:6.1f}      {I_FS:6.1f}      '
-                   f'    {M_LU:6.1f}      {I_LU:6.1f}', end='\r' )
-
-
-        def get_coeffs(fs, f0, Q, ftype, dBgain=0.0):
-            """ this calculates coeffs and initial conditions
-                for signal.lfilter
-            """
-            b, a = biquad( fs, f0, Q, ftype, dBgain )
-            zi   = lfilter_zi(b, a)
-            return b, a, zi
-
-
-        def k_filter(x):
-            """ input:  stereo audio block: x[:, channel]
-                output: x K-filtered, 100Hz HPF + 1000Hz High Shelf +4dB
-            """
-            y = np.copy( x )
-            # coeffs includes 'b', 'a' and initial condition 'zi' for lfilter
-            # hpf_coeffs     -->  100Hz HPF
-            # hshelf_coeffs  -->  1000Hz High Shelf +4dB
-            for coeffs in (hpf_coeffs, hshelf_coeffs):
-                b, a, zi = coeffs
-                y[:, 0], _ = lfilter( b, a, x[:,0], zi = zi * x[:, 0][0] )
-                y[:, 1], _ = lfilter( b, a, x[:,1], zi = zi * x[:, 1][0] )
-            return y
-
-
-        def callback(indata, frames, time, status):
-            """ The handler for input stream audio chunks,
-                simply puts data into the input-queue
-            """
-            if status:
-                print( f'----- {status} -----' )
-            qIn.put( indata )
-
-
-        def loop_forever():
-            """ loop capturing stream and processing audio blocks """
-
-            # Initialize cummulative mean and gates
-            G1mean  = -100.0
-            G1      = 0
-            G2      = 0
-            # Memorize last measurements used for evaluate if threshold exceeded
-            M_last = -100.0
-            I_last = -100.0
-
-            with sd.InputStream(  device=self.device,
-                                  callback=callback,
-                                  blocksize=bs,
-                                  samplerate=fs,
-                                  channels= 2,
-                                  dither_off=True):
-                while True:
-
-                    # Reading captured blocks of 100 ms from the input-queue
-                    b100 = qIn.get()
-
-                    # “K” weight filtering the 100ms chunks
-                    k100 = k_filter(b100)
-
-                    # Sliding the 400ms (w)indow and filling it with k100 chunks
-                    w400[ : bs * 3 ] = w400[ bs : ]
-                    w400[ bs * 3 : ] = k100
-
-                    # Mean square calculation for 400ms audio blocks
-                    msqL = np.sum( np.square( w400[:,0] ) ) / (fs * 0.4)
-                    msqR = np.sum( np.square( w400[:,1] ) ) / (fs * 0.4)
-
-                    # Stereo (M)omentary Loudness (divided by 2 channels)
-                    if msqL or msqR:    # avoid log10(0)
-                        # use float to avoid delivery of numpy.float32 types
-                        self.M = -0.691 + 20 * float(np.log10(msqL + msqR)) / 2
-                    else:
-                        self.M = -100.0
-
-                    # Dual gatting to compute (I)ntegrated Loudness.
-                    if self.M > -70.0:
-                        # cumulative moving average
-                        G1 += 1
-                        G1mean = G1mean + (self.M - G1mean) / G1
-
-                    if self.M > (G1mean - 10.0):
-                        G2 += 1
-                        self.I = G1mean + (self.M - G1mean) / G2
-
-                    # End of measurements, let's manage events:
-
-                    # Reseting on the fly.
-                    if self.meas_reset:
-                        print('(lu_meter) restarting measurement')
-                        self.M  = -100.0
-                        self.I  = -100.0
-                        G1mean  = -100.0
-                        G1 = 0
-                        G2 = 0
-                        self.meas_reset = False  # releasing the flag
-
-                    # Prints to console
-                    if self.display:
-                        display_measurements()
-
-                    # Notify an event if changes greater than a given threshold
-                    if abs(M_last - self.M) > self.M_threshold:
-                        self.M_event.set()
-                        M_last = self.M
-                    if abs(I_last - self.I) > self.I_threshold:
-                        self.I_event.set()
-                        I_last = self.I
-
-
-        # Prepare an internal FIFO queue for the callback process
-        qIn = queue.Queue()
-
-        # Getting current Fs from the PortAudio device
-        fs = sd.query_devices(self.device, 'input')['default_samplerate']
-
-        # Block size in samples for 100 msec of audio at Fs
-        bs  = int( fs * 0.100 )
-
-        # Initialize a 400ms stereo block window
-        w400 = np.zeros( (4 * bs, 2) , dtype='float32')
-
-        # Prepare the needed coeffs for 'K' filtering audio blocks
-        hpf_coeffs =    get_coeffs(fs, 100,  .707, 'hpf'            )
-        hshelf_coeffs = get_coeffs(fs, 1000, .707, 'highshelf', 4.0 )
+    def stop(self):
+        """ Stops metering, and closes the publisher if any """
+        super().stop()
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
+
+
+    def snapshot(self):
+        """ A copy of the current measurement histograms (hist_M, hist_S),
+            e.g. to keep the [I] and [LRA] figures before a reset.
+        """
+        return self.hist_M.snapshot(), self.hist_S.snapshot()
+
+
+    def _display_header(self):
+        print(f'    -------------- dBFS --------------      ------------ dBLU @ -23dBFS -----------')
+        print(f'    Momentary   Short term   Integrated      Momentary   Short term   Integrated')
+
+
+    def _display_measurements(self):
+        # A header must be already displayed
+        M_FS = round(self.M, 1)
+        S_FS = round(self.S, 1)
+        I_FS = round(self.I, 1)
+        M_LU = M_FS - -23.0        # from dBFS to dBLU ( 0 dBLU = -23dBFS )
+        S_LU = S_FS - -23.0
+        I_LU = I_FS - -23.0
+        print( f'    {M_FS:6.1f}      {S_FS:6.1f}       {I_FS:6.1f}      '
+               f'    {M_LU:6.1f}      {S_LU:6.1f}       {I_LU:6.1f}', end='\r' )
+
+
+    def _setup(self):
+
+        # A ring of 100 ms blocks energies for the 400 ms and 3 s windows
+        self._ring = BlockRing( lengths=(4, 30) )
+
+        # Prepare the 'K' filter for audio blocks
+        self._k_filter = K_filter(self.fs)
+
+        # Memorize last measurements used for evaluate if threshold exceeded
+        self._M_last = -100.0
+        self._I_last = -100.0
 
         # Prepare display header
         if self.display:
-            display_header()
+            self._display_header()
+
+
+    def _accumulate(self, b100):
+        """ “K” weight filtering a 100 ms block, then the mean square
+            of each channel
+        """
+        k100 = self._k_filter(b100)
+        return np.mean( np.square(k100), axis=0 )
+
+
+    def _measure(self, e100):
+        """ Updates the measurements from the channels energies
+            of a 100 ms block
+        """
+        ring = self._ring
+
+        # weighted sum of all channels, goes into the blocks ring
+        ring.push( float( e100 @ self.weights ) )
+
+        # (M)omentary Loudness (400 ms window)
+        msq = ring.mean(4)
+        if msq:     # avoid log10(0)
+            # use float to avoid delivery of numpy.float32 types
+            self.M = -0.691 + 10 * float(np.log10(msq))
+        else:
+            self.M = -100.0
+
+        # (S)hort term Loudness (3 s window)
+        msq = ring.mean(30)
+        if msq:
+            self.S = -0.691 + 10 * float(np.log10(msq))
+        else:
+            self.S = -100.0
+
+        # (I)ntegrated Loudness and Loudness Range, gated
+        # from the histograms of 400 ms and 3 s blocks
+        # (i) only complete windows, as in analyze_file
+        if ring.count >= 4:
+            self.hist_M.add( ring.mean(4)  )
+        if ring.count >= 30:
+            self.hist_S.add( ring.mean(30) )
+        self.I   = self.hist_M.integrated()
+        self.LRA = self.hist_S.lra()
+
+        # End of measurements, let's manage events:
+
+        # Reseting on the fly.
+        if self.meas_reset:
+            print('(lu_meter) restarting measurement')
+            self.M   = -100.0
+            self.S   = -100.0
+            self.I   = -100.0
+            self.LRA = 0.0
+            self.hist_M.reset()
+            self.hist_S.reset()
+            self.meas_reset = False  # releasing the flag
+
+        # Publish the measurement frame
+        if self.publisher:
+            self.publisher.publish( (self.M, self.S, self.I, self.LRA) )
+
+        # Prints to console
+        if self.display:
+            self._display_measurements()
 
-        # Launch a thread that loops metering audio blocks forever
-        jloop = threading.Thread( target=loop_forever, args=() )
-        jloop.start()
+        # Notify an event if changes greater than a given threshold
+        if abs(self._M_last - self.M) > self.M_threshold:
+            self.M_event.set()
+            self._M_last = self.M
+        if abs(self._I_last - self.I) > self.I_threshold:
+            self.I_event.set()
+            self._I_last = self.I
 
+        return {'M': self.M, 'S': self.S, 'I': self.I, 'LRA': self.LRA}
 
 if __name__ == '__main__':
 
     # Reading command line args
     args = parse_cmdline()
 
+    # Offline analysis of audio files
+    if args.file:
+        for fname in args.file:
+            t0 = time.time()
+            try:
+                res = analyze_file( fname, fs=args.samplerate, channels=args.channels,
+                                    weights=args.weights )
+            except ValueError as e:
+                # channel weights not matching the file channels
+                print(f'{fname}: {e}')
+                continue
+            elapsed = time.time() - t0
+            print( f'{fname}:\n'
+                   f'    I: {res["I"]:6.1f} LUFS   LRA: {res["LRA"]:5.1f} LU   '
+                   f'M max: {res["M_max"]:6.1f} LUFS   S max: {res["S_max"]:6.1f} LUFS   '
+                   f'TP: {res["TP"]:5.1f} dBTP\n'
+                   f'    ({res["duration"]:.1f} s of audio analyzed in {elapsed:.2f} s, '
+                   f'x{res["duration"] / elapsed:.0f} real time)' )
+        sys.exit()
+
     # Prepare a meter instance
-    meter = LU_meter(device=args.input_device, display=True)
+    # Optional publishing of measurements
+    publisher = None
+    if args.publish or args.socket:
+        publisher = MeterPublisher( LU_FIELDS, sock_path=args.socket,
+                                    fmt=args.format )
+
+    meter = LU_meter( device=args.input_device, display=True,
+                      callback_metering=args.callback_metering,
+                      channels=args.channels, weights=args.weights,
+                      publisher=publisher )
 
     # Do start metering
     meter.start()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2019 Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+    Scans folders of audio files (.wav) and measures their [I]ntegrated
+    loudness, Loudness Range [LRA] and True Peak [TP], as per EBU R128.
+
+    The results are kept in a JSON index file, keyed by the file path,
+    size and modification time, so that a new scan of the same folders
+    only measures new or modified files. Files that could not be measured
+    are not indexed, so they are tried again on the next scan.
+
+    Files are measured in parallel by a pool of processes.
+
+    (see loudness_meter.py for the measurement details)
+
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from loudness_meter import analyze_file
+
+
+INDEX_FILE = os.path.expanduser('~/.cache/audiotools/loudness_scan.json')
+
+# The index is saved after this number of measured files,
+# so that an interrupted scan does not lose all the work done.
+SAVE_EVERY = 50
+
+
+def parse_cmdline():
+
+    parser = argparse.ArgumentParser(description=__doc__,
+              formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('paths', nargs='+',
+            help='folders or files to scan')
+
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+            help='number of processes (default: 0, all cpu cores)')
+
+    parser.add_argument('-i', '--index', type=str, default=INDEX_FILE,
+            help=f'index file (default: {INDEX_FILE})')
+
+    parser.add_argument('-ext', '--extensions', type=str, default='.wav',
+            help='comma separated file extensions to scan (default: .wav)')
+
+    parser.add_argument('-r', '--rescan', action='store_true',
+            help='measure all files, also the unchanged ones')
+
+    parser.add_argument('-q', '--quiet', action='store_true',
+            help='do not print each file results')
+
+    args = parser.parse_args()
+
+    if args.jobs < 0:
+        parser.error('jobs must be 0 (all cpu cores) or greater')
+
+    return args
+
+
+def load_index(fname):
+
+    if not os.path.isfile(fname):
+        return {}
+
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+
+def save_index(index, fname):
+
+    folder = os.path.dirname( os.path.abspath(fname) )
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    # Writing to a temporary file then renaming, so that
+    # an interrupted save does not damage the index
+    tmp = f'{fname}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, fname)
+
+
+def find_files(paths, extensions):
+
+    for path in paths:
+
+        if os.path.isfile(path):
+            yield os.path.abspath(path)
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fname in sorted(files):
+                if os.path.splitext(fname)[1].lower() in extensions:
+                    yield os.path.abspath( os.path.join(root, fname) )
+
+
+def measure(fpath):
+    """ The worker job, returns a tuple (fpath, results)
+    """
+    try:
+        res = analyze_file(fpath, truepeak=True)
+    except Exception as e:
+        res = {'error': str(e)}
+    return fpath, res
+
+
+def print_result(fpath, res):
+
+    if 'error' in res:
+        print( f'   ERROR: {res["error"]}  {fpath}' )
+    else:
+        print( f'{res["I"]:6.1f} LUFS {res["LRA"]:5.1f} LU {res["TP"]:5.1f} dBTP  {fpath}' )
+
+
+def scan(paths, index_fname=INDEX_FILE, jobs=0, extensions=('.wav',),
+         rescan=False, quiet=False):
+    """ Scans paths and updates the index file,
+        returns the index dictionary
+    """
+    index = load_index(index_fname)
+
+    # Files to be measured: new or modified ones
+    todo = []
+    nfiles = 0
+    for fpath in find_files(paths, extensions):
+        nfiles += 1
+        st = os.stat(fpath)
+        entry = index.get(fpath)
+        if ( not rescan and entry and entry['size']  == st.st_size
+                                  and entry['mtime'] == st.st_mtime ):
+            continue
+        todo.append( (fpath, st.st_size, st.st_mtime) )
+
+    print( f'(loudness_scan) {nfiles} files found, {len(todo)} to be measured' )
+
+    if not todo:
+        return index
+
+    t0 = time.time()
+    duration = 0.0
+    nerrors = 0
+    sizes = { fpath: (size, mtime) for fpath, size, mtime in todo }
+
+    with ProcessPoolExecutor( max_workers=jobs or None ) as executor:
+
+        futures = [ executor.submit(measure, fpath) for fpath, _, _ in todo ]
+
+        for n, future in enumerate(as_completed(futures), 1):
+
+            fpath, res = future.result()
+            if 'error' in res:
+                # not indexed, so it will be measured again next time
+                index.pop(fpath, None)
+                nerrors += 1
+            else:
+                size, mtime = sizes[fpath]
+                index[fpath] = dict( res, size=size, mtime=mtime )
+                duration += res['duration']
+
+            if not quiet:
+                print_result(fpath, res)
+
+            if n % SAVE_EVERY == 0:
+                save_index(index, index_fname)
+
+    save_index(index, index_fname)
+
+    elapsed = time.time() - t0
+    print( f'(loudness_scan) {len(todo)} files ({nerrors} errors) in {elapsed:.1f} s: '
+           f'{len(todo) / elapsed:.1f} files/s, x{duration / elapsed:.0f} real time, '
+           f'jobs: {jobs or os.cpu_count()}' )
+
+    return index
+
+
+if __name__ == '__main__':
+
+    args = parse_cmdline()
+
+    extensions = tuple( e.strip().lower() if e.strip().startswith('.')
+                        else f'.{e.strip().lower()}'
+                        for e in args.extensions.split(',') )
+
+    scan( args.paths, index_fname=args.index, jobs=args.jobs,
+          extensions=extensions, rescan=args.rescan, quiet=args.quiet )
+
+    print( f'(loudness_scan) index: {args.index}' )
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    Several meters on a single capture of a sound device.
+
+    The audio blocks are captured once, then every block is given to
+    all the analyzers (level_meter.Meter, loudness_meter.LU_meter), and
+    the steps they share, like the K weighting filter, are computed once
+    per block.
+
+    To view suported devices use '-l' option
+
+"""
+import argparse
+import numpy as np
+
+from level_meter import StreamMeter, Meter, sd
+from loudness_meter import LU_meter, K_filter
+
+
+def int_or_str(text):
+    """Helper function for argument parsing."""
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def parse_cmdline():
+
+    parser = argparse.ArgumentParser(description=__doc__,
+              formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-l', '--list-devices', action='store_true',
+            help='list audio devices and exit')
+
+    parser.add_argument('-id', '--input_device', type=int_or_str,
+            default='pre_in_loop',
+            help='input device (numeric ID or substring, see -l)')
+
+    parser.add_argument('-ch', '--channels', type=int, default=2,
+            help='channels to measure (default: 2)')
+
+    parser.add_argument('-a', '--analyzers', type=str, default='peak,rms,lu',
+            help='comma separated analyzers: \'lu\' or any level_meter mode, '
+                 'e.g. \'peak,rms,lu,rta\' (default: peak,rms,lu)')
+
+    args = parser.parse_args()
+
+    if args.list_devices:
+        if sd is None:
+            parser.exit(1, 'sounddevice is not available\n')
+        print(sd.query_devices())
+        parser.exit(0)
+
+    return args
+
+
+class SharedStep(object):
+    """
+        A block processing step shared by several analyzers, it is
+        computed only once per pipeline block.
+
+        step = SharedStep(pipeline, func)
+
+        y = step(x)     func(x) for the current pipeline block
+    """
+
+
+    def __init__(self, pipeline, func):
+        self.pipeline   = pipeline
+        self.func       = func
+        self.nblock     = -1
+        self.y          = None
+
+
+    def __call__(self, x):
+        if self.nblock != self.pipeline.nblocks:
+            self.y      = self.func(x)
+            self.nblock = self.pipeline.nblocks
+        return self.y
+
+
+class MeterPipeline(StreamMeter):
+    """
+        A single capture stage for several analyzers.
+        (see level_meter.StreamMeter for .start(), .stop(), .frames() ...)
+
+        The audio callback copies each block into a preallocated ring
+        (.handoff), then the blocks are read into a preallocated buffer
+        that is given to every analyzer, so the audio is not copied for
+        each analyzer.
+
+        p = MeterPipeline(device, channels=2)
+
+        p.add('lu',   LU_meter(None))
+        p.add('peak', Meter(None, mode='peak', bar=False))
+
+        .add(name, analyzer)    Add a StreamMeter analyzer, its device is not
+                                used and its channels must be the pipeline ones
+
+        .analyzers      The analyzers dictionary
+
+        .shared(name, func)     The SharedStep 'name', created with func
+                                if not exists
+
+        .nblocks        Blocks processed
+
+        .display        On console use, will display a line of measurements
+
+        the measurement frames are {name: analyzer frame, ...}
+    """
+
+
+    def __init__(self, device, channels=2, ring_slots=32, display=False):
+        super().__init__(device, channels=channels, callback_metering=True,
+                         ring_slots=ring_slots)
+        self.display    = display
+        self.analyzers  = {}
+        self.steps      = {}
+        self.nblocks    = 0
+
+
+    def add(self, name, analyzer):
+        if analyzer.channels != self.channels:
+            raise ValueError(f'analyzer \'{name}\' has {analyzer.channels} '
+                             f'channels, the pipeline has {self.channels}')
+        self.analyzers[name] = analyzer
+        return analyzer
+
+
+    def shared(self, name, func):
+        if name not in self.steps:
+            self.steps[name] = SharedStep(self, func)
+        return self.steps[name]
+
+
+    def _setup(self):
+
+        self.steps   = {}
+        self.nblocks = 0
+
+        # The block buffer all analyzers read from
+        self._out = np.zeros( (self.bs, self.channels) )
+
+        for a in self.analyzers.values():
+            a.fs, a.bs = self.fs, self.bs
+            a._setup()
+            # K weighting only once for all loudness meters
+            if isinstance(a, LU_meter):
+                a._k_filter = self.shared( 'k_filter', K_filter(self.fs) )
+
+
+    def _values_shape(self):
+        # The whole audio block goes through the handoff ring
+        return (self.bs, self.channels)
+
+
+    def _accumulate(self, block):
+        # (i) copied into the handoff ring slot
+        return block
+
+
+    def _measure(self, block):
+
+        frame = {}
+        for name, a in self.analyzers.items():
+            frame[name] = a._measure( a._accumulate(block) )
+
+        self.nblocks += 1
+
+        if self.display:
+            self._display_measurements(frame)
+
+        return frame
+
+
+    def _display_measurements(self, frame):
+        line = ''
+        for name, f in frame.items():
+            if 'L' in f:
+                line += f'  {name}: {f["L"]:6.1f}'
+            else:
+                line += f'  M: {f["M"]:6.1f}  S: {f["S"]:6.1f}  I: {f["I"]:6.1f}'
+        print(line, end='\r')
+
+
+if __name__ == '__main__':
+
+    # Reading command line args
+    args = parse_cmdline()
+
+    p = MeterPipeline( device=args.input_device, channels=args.channels,
+                       display=True )
+
+    for name in args.analyzers.split(','):
+        if name == 'lu':
+            p.add( name, LU_meter(None, channels=args.channels) )
+        else:
+            p.add( name, Meter(None, mode=name, bar=False,
+                               channels=args.channels) )
+
+    # Do start metering
+    p.start()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    Publishes meter measurements to other local processes.
+
+    Each measurement frame is written to a shared memory struct protected
+    by a sequence counter (a seqlock), so any number of readers can poll
+    the last frame without disturbing the writer. Optionally, frames are
+    also sent to the clients of a UNIX socket, as compact binary or as
+    JSON lines.
+
+    Shared memory layout (little endian):
+
+        seq         uint64      odd while the frame is being written
+        n           uint64      number of values
+        values      n float64   'time' followed by the meter fields
+        names       n * 16 bytes (ascii, null padded)
+
+    Socket clients first receive a JSON header line
+    {"fields": [...], "fmt": "bin" | "json"}, then the frames:
+
+        binary:     uint64 seq followed by the n float64 values
+        JSON:       {"seq": .., "time": .., "M": .., ...}\\n
+
+    Command line usage, to watch a publishing meter:
+
+        meter_publisher.py  [-n NAME | -s SOCKET_PATH]
+
+"""
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+
+# Default shared memory name for the LU_meter
+SHM_NAME    = 'audiotools_lu'
+# Max length of the field names
+NAME_LEN    = 16
+# The LU_meter published fields
+LU_FIELDS   = ('M', 'S', 'I', 'LRA')
+
+
+def parse_cmdline():
+
+    parser = argparse.ArgumentParser(description=__doc__,
+              formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-n', '--name', type=str, default=SHM_NAME,
+            help=f'shared memory name to read (default: {SHM_NAME})')
+
+    parser.add_argument('-s', '--socket', type=str,
+            help='UNIX socket path to subscribe to, instead of shared memory')
+
+    parser.add_argument('-i', '--interval', type=float, default=0.1,
+            help='shared memory polling interval in seconds (default: 0.1)')
+
+    return parser.parse_args()
+
+
+def _layout(n):
+    """ Byte offsets of the values and names areas, and the total size
+    """
+    values = 16
+    names  = values + 8 * n
+    return values, names, names + NAME_LEN * n
+
+
+class MeterPublisher(object):
+    """
+        Writes measurement frames to shared memory, and optionally to the
+        clients of a UNIX socket.
+
+        p = MeterPublisher(fields, name=SHM_NAME, sock_path=None, fmt='bin')
+
+        .publish(values)    Publish a frame (a sequence of values
+                            in the order of fields)
+
+        .close()            Releases the shared memory and the socket
+
+        .fields             The field names, 'time' is added as the first one
+
+        .seq                Frames published
+
+        .clients            Number of socket clients connected
+
+        Socket clients never block the publisher: a client whose socket
+        buffer is full skips frames, and it is dropped if a frame could
+        only be partially sent.
+    """
+
+
+    def __init__(self, fields, name=SHM_NAME, sock_path=None, fmt='bin'):
+
+        if fmt not in ('bin', 'json'):
+            raise ValueError(f'bad format \'{fmt}\', use \'bin\' or \'json\'')
+
+        self.fields = ('time',) + tuple(fields)
+        self.name   = name
+        self.fmt    = fmt
+        self.seq    = 0
+        n = len(self.fields)
+
+        # The shared memory struct
+        ofs_values, ofs_names, size = _layout(n)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=size)
+        except FileExistsError:
+            # left behind by a previous meter that was killed
+            old = shared_memory.SharedMemory(name=name)
+            old.unlink()
+            old.close()
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=size)
+
+        self._hdr    = np.ndarray( (2,), dtype='<u8', buffer=self.shm.buf )
+        self._values = np.ndarray( (n,), dtype='<f8', buffer=self.shm.buf,
+                                   offset=ofs_values )
+        self._hdr[:] = (0, n)
+        self.shm.buf[ofs_names : size] = b''.join(
+            f.encode('ascii')[:NAME_LEN].ljust(NAME_LEN, b'\0') for f in self.fields )
+
+        # The optional socket
+        self._packer    = struct.Struct(f'<Q{n}d')
+        self._clients   = []
+        self._lock      = threading.Lock()
+        self.sock_path  = sock_path
+        self.sock       = None
+        if sock_path:
+            if os.path.exists(sock_path):
+                os.remove(sock_path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(sock_path)
+            self.sock.listen()
+            threading.Thread( target=self._accept, daemon=True ).start()
+
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+
+    def _accept(self):
+        """ Accepting socket clients forever """
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                # the socket was closed
+                return
+            try:
+                conn.sendall( (json.dumps({'fields': self.fields, 'fmt': self.fmt}) + '\n').encode() )
+            except OSError:
+                conn.close()
+                continue
+            conn.setblocking(False)
+            with self._lock:
+                self._clients.append(conn)
+
+
+    def publish(self, values):
+
+        values = [time.time()] + [float(v) for v in values]
+
+        # seqlock write: odd seq while writing, even when done
+        self._hdr[0] = 2 * self.seq + 1
+        self._values[:] = values
+        self.seq += 1
+        self._hdr[0] = 2 * self.seq
+
+        if not self._clients:
+            return
+
+        if self.fmt == 'bin':
+            frame = self._packer.pack(self.seq, *values)
+        else:
+            d = {'seq': self.seq}
+            d.update( zip(self.fields, values) )
+            frame = (json.dumps(d) + '\n').encode()
+
+        with self._lock:
+            for conn in self._clients[:]:
+                try:
+                    sent = conn.send(frame)
+                except BlockingIOError:
+                    # a slow client, skips this frame
+                    continue
+                except OSError:
+                    sent = 0
+                if sent < len(frame):
+                    # disconnected, or the frame is broken for this client
+                    conn.close()
+                    self._clients.remove(conn)
+
+
+    def close(self):
+
+        if self.sock:
+            self.sock.close()
+            with self._lock:
+                for conn in self._clients:
+                    conn.close()
+                self._clients = []
+            if os.path.exists(self.sock_path):
+                os.remove(self.sock_path)
+
+        del self._hdr, self._values
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedFrameReader(object):
+    """
+        Reads the last frame from a MeterPublisher shared memory.
+
+        r = SharedFrameReader(name=SHM_NAME)
+
+        .read()     Returns the last frame as a dictionary, including
+                    its 'seq' number (0 if nothing published yet)
+
+        .fields     The field names
+
+        .close()
+    """
+
+
+    def __init__(self, name=SHM_NAME):
+
+        try:
+            # (i) Python >= 3.13, do not unlink the writer memory on exit
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # the reader must not be tracked, so it is not registered
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args: None
+            try:
+                self.shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+        self._hdr   = np.ndarray( (2,), dtype='<u8', buffer=self.shm.buf )
+        n = int(self._hdr[1])
+        ofs_values, ofs_names, size = _layout(n)
+        self._values = np.ndarray( (n,), dtype='<f8', buffer=self.shm.buf,
+                                   offset=ofs_values )
+        names = bytes( self.shm.buf[ofs_names : size] )
+        self.fields = tuple( names[i : i + NAME_LEN].rstrip(b'\0').decode('ascii')
+                             for i in range(0, len(names), NAME_LEN) )
+
+
+    def read(self):
+
+        # seqlock read: retry if the writer was in the middle of a frame
+        while True:
+            seq1 = int(self._hdr[0])
+            if seq1 % 2:
+                time.sleep(0)
+                continue
+            values = self._values.copy()
+            if int(self._hdr[0]) == seq1:
+                break
+
+        d = {'seq': seq1 // 2}
+        d.update( zip(self.fields, values.tolist()) )
+        return d
+
+
+    def close(self):
+        del self._hdr, self._values
+        self.shm.close()
+
+
+def subscribe(sock_path):
+    """ A generator of the frames (dictionaries) from a publisher socket,
+        the frames format is given by the publisher in the header line
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+
+        s.connect(sock_path)
+        f = s.makefile('rb')
+
+        header = json.loads( f.readline() )
+        fields = header['fields']
+
+        if header['fmt'] == 'json':
+            for line in f:
+                yield json.loads(line)
+            return
+
+        packer = struct.Struct(f'<Q{len(fields)}d')
+        while True:
+            frame = f.read(packer.size)
+            if len(frame) < packer.size:
+                return
+            seq, *values = packer.unpack(frame)
+            d = {'seq': seq}
+            d.update( zip(fields, values) )
+            yield d
+
+
+if __name__ == '__main__':
+
+    args = parse_cmdline()
+
+    try:
+        if args.socket:
+            for d in subscribe(args.socket):
+                print(d)
+
+        else:
+            r = SharedFrameReader(args.name)
+            seq = -1
+            while True:
+                d = r.read()
+                if d['seq'] != seq:
+                    seq = d['seq']
+                    print(d)
+                time.sleep(args.interval)
+
+    except KeyboardInterrupt:
+        sys.exit()
@@ -30,7 +30,9 @@
 #   'ssp'   suele referirse a un semi spectro
 # -----------------------------------------------------------
 
+from functools import lru_cache
 import numpy as np
+import scipy.fft
 from scipy import signal, interpolate
 
 def biquad(fs, f0, Q, ftype, dBgain=0.0):
@@ -53,74 +55,136 @@ def biquad(fs, f0, Q, ftype, dBgain=0.0):
         ###  http://www.musicdsp.org/files/Audio-EQ-Cookbook.txt  ###
         #############################################################
     """
+    b, a = biquad_bank(fs, f0, Q, ftype, dBgain)
+    return b[0], a[0]
 
-    if (Q <= 0):
+
+def biquad_bank(fs, f0, Q, ftype, dBgain=0.0):
+    """
+    Versión vectorizada de biquad: fs, f0, Q, ftype y dBgain pueden ser
+    arrays (o listas), que se combinan por broadcasting de numpy.
+
+    OUTPUT:
+
+        (b,a):      arrays de coeficientes de shape (n, 3), uno por biquad
+    """
+    fs, f0, Q, dBgain, ftype = np.broadcast_arrays(
+                                    *[ np.atleast_1d(np.asarray(x, dtype=float))
+                                       for x in (fs, f0, Q, dBgain) ],
+                                    np.char.lower( np.atleast_1d(ftype).astype(str) ) )
+
+    if np.any(Q <= 0):
         raise ValueError("Q must be positive");
 
-    if (f0 <= 0) or (fs <= 0):
+    if np.any(f0 <= 0) or np.any(fs <= 0):
         raise ValueError("f must be positive");
 
+    unknown = set(np.unique(ftype)) - set(_BIQUAD_COEFFS)
+    if unknown:
+        raise ValueError(f"Wrong biquad type: {', '.join(sorted(unknown))}")
 
-    A     = np.sqrt(10 ** (dBgain / 20.0))
-    w0    = 2.0 * np.pi * f0 / fs
-    alpha = np.sin(w0) / (2.0 * Q)
-
-    if ftype.lower() == "lpf":
-        b0 =  (1 - np.cos(w0)) / 2
-        b1 =   1 - np.cos(w0)
-        b2 =  (1 - np.cos(w0)) / 2
-        a0 =   1 + alpha
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha
-
-    elif ftype.lower() == "hpf":
-        b0 =  (1 + np.cos(w0)) / 2
-        b1 = -(1 + np.cos(w0))
-        b2 =  (1 + np.cos(w0)) / 2
-        a0 =   1 + alpha
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha
-
-    elif ftype.lower() == "notch":
-        b0 =   1
-        b1 =  -2 * np.cos(w0)
-        b2 =   1
-        a0 =   1 + alpha
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha
-
-    elif ftype.lower() == "peakingeq":
-        b0 =   1 + alpha * A
-        b1 =  -2 * np.cos(w0)
-        b2 =   1 - alpha * A
-        a0 =   1 + alpha / A
-        a1 =  -2 * np.cos(w0)
-        a2 =   1 - alpha / A
-
-    elif ftype.lower() == "lowshelf":
-        b0 =      A * ( (A+1) - (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha )
-        b1 =  2 * A * ( (A-1) - (A+1)*np.cos(w0)                      )
-        b2 =      A * ( (A+1) - (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha )
-        a0 =            (A+1) + (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha
-        a1 = -2 *     ( (A-1) + (A+1)*np.cos(w0)                      )
-        a2 =            (A+1) + (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha
-
-    elif ftype.lower() == "highshelf":
-        b0 =      A * ( (A+1) + (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha )
-        b1 = -2 * A * ( (A-1) + (A+1)*np.cos(w0)                      )
-        b2 =      A * ( (A+1) + (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha )
-        a0 =            (A+1) - (A-1)*np.cos(w0) + 2*np.sqrt(A)*alpha
-        a1 =  2 *     ( (A-1) - (A+1)*np.cos(w0)                      )
-        a2 =            (A+1) - (A-1)*np.cos(w0) - 2*np.sqrt(A)*alpha
+    A     = np.sqrt(10 ** (dBgain.ravel() / 20.0))
+    w0    = 2.0 * np.pi * f0.ravel() / fs.ravel()
+    alpha = np.sin(w0) / (2.0 * Q.ravel())
+    ftype = ftype.ravel()
 
-    else:
-        raise ValueError("Wrong biquad type")
+    b = np.empty( (len(w0), 3) )
+    a = np.empty( (len(w0), 3) )
+
+    # Se calculan de una vez todos los biquads de cada tipo
+    for name, coeffs in _BIQUAD_COEFFS.items():
+        m = ftype == name
+        if m.any():
+            b[m], a[m] = coeffs( A[m], np.cos(w0[m]), alpha[m] )
 
-    a = np.array([a0, a1, a2])
-    b = np.array([b0, b1, b2])
     return b, a
 
 
+def _lpf(A, cosw0, alpha):
+    b = [ (1 - cosw0) / 2,   1 - cosw0,   (1 - cosw0) / 2 ]
+    a = [  1 + alpha,       -2 * cosw0,    1 - alpha      ]
+    return np.transpose(b), np.transpose(a)
+
+
+def _hpf(A, cosw0, alpha):
+    b = [ (1 + cosw0) / 2, -(1 + cosw0),  (1 + cosw0) / 2 ]
+    a = [  1 + alpha,       -2 * cosw0,    1 - alpha      ]
+    return np.transpose(b), np.transpose(a)
+
+
+def _notch(A, cosw0, alpha):
+    b = [ np.ones_like(cosw0), -2 * cosw0,  np.ones_like(cosw0) ]
+    a = [  1 + alpha,          -2 * cosw0,  1 - alpha           ]
+    return np.transpose(b), np.transpose(a)
+
+
+def _peakingeq(A, cosw0, alpha):
+    b = [  1 + alpha * A,  -2 * cosw0,  1 - alpha * A ]
+    a = [  1 + alpha / A,  -2 * cosw0,  1 - alpha / A ]
+    return np.transpose(b), np.transpose(a)
+
+
+def _lowshelf(A, cosw0, alpha):
+    b = [      A * ( (A+1) - (A-1)*cosw0 + 2*np.sqrt(A)*alpha ),
+           2 * A * ( (A-1) - (A+1)*cosw0                      ),
+               A * ( (A+1) - (A-1)*cosw0 - 2*np.sqrt(A)*alpha ) ]
+    a = [            (A+1) + (A-1)*cosw0 + 2*np.sqrt(A)*alpha,
+          -2 *     ( (A-1) + (A+1)*cosw0                      ),
+                     (A+1) + (A-1)*cosw0 - 2*np.sqrt(A)*alpha   ]
+    return np.transpose(b), np.transpose(a)
+
+
+def _highshelf(A, cosw0, alpha):
+    b = [      A * ( (A+1) + (A-1)*cosw0 + 2*np.sqrt(A)*alpha ),
+          -2 * A * ( (A-1) + (A+1)*cosw0                      ),
+               A * ( (A+1) + (A-1)*cosw0 - 2*np.sqrt(A)*alpha ) ]
+    a = [            (A+1) - (A-1)*cosw0 + 2*np.sqrt(A)*alpha,
+           2 *     ( (A-1) - (A+1)*cosw0                      ),
+                     (A+1) - (A-1)*cosw0 - 2*np.sqrt(A)*alpha   ]
+    return np.transpose(b), np.transpose(a)
+
+
+_BIQUAD_COEFFS = {  'lpf':          _lpf,
+                    'hpf':          _hpf,
+                    'notch':        _notch,
+                    'peakingeq':    _peakingeq,
+                    'lowshelf':     _lowshelf,
+                    'highshelf':    _highshelf  }
+
+
+def biquad_sos(fs, f0, Q, ftype, dBgain=0.0):
+    """
+    Un banco de biquads como secciones de segundo orden (SOS) para
+    scipy.signal.sosfilt, sosfreqz, etc.
+
+    fs, f0, Q, ftype y dBgain pueden ser escalares o arrays (broadcasting),
+    ver biquad() para su significado.
+
+    OUTPUT:
+
+        sos:        array de shape (n, 6), una fila [b0 b1 b2 1 a1 a2] por biquad
+
+    Los bancos ya calculados se memorizan (lru_cache), así que pedir
+    repetidamente los mismos parámetros no vuelve a calcularlos.
+    """
+    fs, f0, Q, dBgain, ftype = np.broadcast_arrays(
+                                    *[ np.atleast_1d(np.asarray(x, dtype=float))
+                                       for x in (fs, f0, Q, dBgain) ],
+                                    np.atleast_1d(ftype).astype(str) )
+
+    # Los parámetros como tuplas para poder usarlos como clave de la caché
+    key = tuple( tuple(x.ravel().tolist()) for x in (fs, f0, Q, ftype, dBgain) )
+
+    # Se devuelve una copia, el array de la caché no debe modificarse
+    return _biquad_sos_cached(*key).copy()
+
+
+@lru_cache(maxsize=1024)
+def _biquad_sos_cached(fs, f0, Q, ftype, dBgain):
+    b, a = biquad_bank(fs, f0, Q, ftype, dBgain)
+    return np.hstack( (b, a) ) / a[:, :1]
+
+
 def biqshelving(fs, f1, f2, type):
     """
     %% Obtiene los coeficientes 'b,a' del filtro IIR asociado a
@@ -385,12 +449,62 @@ def minphsp(sp):
     %% minph    = Espectro completo de fase mínima
     %%            con la misma magnitud de espectro que sp.
     %% sp       = Espectro completo. Longitud par.
+
+    Nota del trad: DSD usa la transformada de Hilbert del espectro completo,
+                   aquí se calcula el semiespectro con minphssp() y se
+                   completa con las frecuencias negativas (conjugadas).
     """
 
     if not sp.ndim == 1:
         raise ValueError("sp must be a vector")
 
-    return np.exp( np.conj( signal.hilbert( np.log(np.abs(sp)) ) ) )
+    m = len(sp)
+    ssp = minphssp( np.abs(sp[:m//2+1]), m )
+    nsp = np.flipud( np.conj( ssp[1:(m-1)//2+1] ) )  # freqs negativas
+    return np.concatenate([ssp, nsp])
+
+
+def minphssp(ssp, m=None, dtype=None, log=False):
+    """
+    'minimum phase semispectrum'
+
+    Obtiene el semiespectro de fase mínima a partir de un semiespectro
+    de magnitudes de frecuencias positivas 'ssp', mediante el cepstrum real
+    calculado con rfft/irfft. Equivale a minphsp() sobre el espectro
+    completo, pero con la mitad de memoria y de cálculo FFT.
+
+    ssp:    semiespectro de magnitudes entre 0 y m/2 (longitud m//2+1),
+            puede ser un array 2-D de semiespectros a lo largo del último eje.
+    m:      longitud del espectro completo (por defecto par: 2*(len(ssp)-1))
+    dtype:  'float32' para calcular en simple precisión (por defecto, la de ssp)
+    log:    devuelve el logaritmo del semiespectro: log(magnitud) + j·fase,
+            donde la fase ya viene desenrollada (no precisa np.unwrap)
+
+    Devuelve el semiespectro complejo de fase mínima con la misma magnitud.
+    """
+
+    n = ssp.shape[-1]
+    if m is None:
+        m = 2 * (n - 1)
+    if n != m // 2 + 1:
+        raise ValueError("minphssp: ssp length must be m//2+1")
+
+    logmag = np.log(np.abs(ssp))
+    if dtype:
+        logmag = logmag.astype(dtype)
+
+    # Cepstrum real, solo se precisa la mitad causal
+    c = scipy.fft.irfft(logmag, m, axis=-1)[..., :n]
+
+    # Plegado: se duplican los coeficientes causales y se anulan los no causales
+    c[..., 1:(m+1)//2] *= 2
+
+    logsp = scipy.fft.rfft(c, m, axis=-1)
+
+    if log:
+        return logsp
+    else:
+        return np.exp( logsp )
 
 
 def wholespmp(ssp):
@@ -42,9 +42,30 @@
 #       grid on
 #
 
+import hashlib
+from collections import OrderedDict
 import numpy as np
+from scipy import sparse
 from tools import logTransition # used for variable smoothing feature
 
+# The Gaussian windows are cut off at NSIGMA standard deviations, so only
+# a band of weights around each frequency is computed and stored.
+# Any discarded weight is below exp(-NSIGMA**2 / 2) ~ 3.7e-6 of the window
+# peak, so the smoothed values will not differ from the full length
+# computation more than ~1e-5 * (max(X) - min(X)),
+# e.g. less than 0.0005 dB when smoothing a dB curve spanning 40 dB.
+NSIGMA = 5
+
+# Max number of Gaussian weights to be computed at once (bounds memory usage)
+CHUNK_NNZ = 2**20
+
+# The smoothing operators are kept in a LRU cache, so that smoothing other
+# curves on an already known grid is just a matrix-vector product.
+# Operators larger than the cache memory bound are not cached.
+CACHE_MAXBYTES  = 256 * 2**20
+_cache          = OrderedDict()     # key --> sparse operator
+_cache_bytes    = 0
+
 def smoothSpectrum(f, X, Noct, f0=0, Tspeed="medium"):
 # Nota: el código original Matlab recibe X,f aquí hemos preferido recibir f,X
 #       por ser más habitual manejar primero el vector de frecuencias de muestreo.
@@ -55,6 +76,9 @@ def smoothSpectrum(f, X, Noct, f0=0, Tspeed="medium"):
 
     'X' can be a log-, magnitude-, or power-spectrum.
 
+    'X' can also be a 2-D array (curves x bins), then every curve
+    is smoothed in one pass sharing the same Gaussian windows.
+
     Setting Noct to 0 results in no smoothing.
 
     Algorithm:
@@ -64,6 +88,10 @@ def smoothSpectrum(f, X, Noct, f0=0, Tspeed="medium"):
     centre frequency is f(i), and whose standard deviation is proportional
     to f(i)/Noct.
 
+    Here the Gaussian is cut off at NSIGMA standard deviations and computed
+    as a sparse banded product, instead of a full length window per bin
+    (see NSIGMA for the tolerance against the full length computation).
+
     See also IOSR.DSP.LTAS, FFT.
 
     Copyright 2016 University of Surrey.
@@ -93,9 +121,11 @@ def smoothSpectrum(f, X, Noct, f0=0, Tspeed="medium"):
     assert(np.all(np.isreal(X))),   "Mag must be real values"
     assert(np.all( f >= 0 )),       "Frec must contain positive values"
     assert(Noct >= 0),              "Noct must be greater than or equal to 0"
-    assert(len(X) == len(f)),       "Mag and Frec must be the same size"
+    assert(X.ndim in (1, 2)),       "Mag must be a vector or a 2-D (curves x bins) array"
+    assert(X.shape[-1] == len(f)),  "Mag and Frec must be the same size"
     assert( f0 > 0 or f0 < max(f) ), "f0 must be in the range of Frec"
     assert( Tspeed in ["slow", "medium", "fast"]), "Tspeed mut be 'slow', 'medium' or 'fast'"
+    assert(np.all( np.diff(f) >= 0 )), "Frec must be in ascending order"
 
     #%% Smoothing
     #% calculates a Gaussian function for each frequency,
@@ -108,10 +138,8 @@ def smoothSpectrum(f, X, Noct, f0=0, Tspeed="medium"):
     # vector 'f' de las frecuencias.
     # Si se pide un smooth variable (f0 <> 0), Noct empezará valiendo N,
     # y cambiará hacia 1 a partir de la f0 (ver tools.logTransition)
-    if f0:
-        Noct = (Noct-1) * logTransition(f, f0, speed=Tspeed) + 1
-    else:
-        Noct = Noct * np.ones( len(f) )
+    Noct0 = Noct
+    Noct  = noct_vector(f, Noct, f0, Tspeed)
     # print(Noct) # DEBUG
     ##################################################################
 
@@ -126,20 +154,221 @@ def smoothSpectrum(f, X, Noct, f0=0, Tspeed="medium"):
     #     x_oct(i) = sum(g.*X);                     % calculate smoothed spectral coefficient
     # end
 
-    # Numpy:
-    start = np.flatnonzero(f)[0]
-    for i in range( start, len(f) ):
-        g = gauss_f(f, f[i], Noct[i])               # 'Noct[i]' is for variable smoothing
-        x_oct[i] = np.sum(g * X)
+    # Numpy: the Gaussian windows are rows of a banded matrix,
+    #        so the smoothed coefficients are a matrix product.
+    S = smoothing_operator(f, Noct0, f0, Tspeed)
+
+    # (i) X.T stands for the bins along the columns of the product,
+    #     so a 2-D X smooths all curves at once.
+    if S is not None:
+        x_oct[:] = (S @ X.T).T
+
+    else:
+        # too large to be cached, let's go chunk by chunk
+        for rows, cols, S in operator_chunks(f, Noct):
+            x_oct[..., rows] = (S @ X[..., cols].T).T
 
     # remove undershoot when Mag is positive
     # if all( X >= 0 )                              # Matlab
     #    x_oct( x_oct < 0 ) = 0;
-    if np.all( X >= 0 ):                            # Numpy
-        x_oct[ x_oct < 0 ] = 0
+    positive = np.all( X >= 0, axis=-1, keepdims=True ) # Numpy (for each curve)
+    x_oct[ (x_oct < 0) & positive ] = 0
 
     return x_oct
 
+
+def smoothing_operator(f, Noct, f0=0, Tspeed="medium", nsigma=NSIGMA):
+    """
+    Returns the (N x N) sparse smoothing operator S for the frequencies 'f',
+    so that the smoothed spectrum is:
+
+        sX = S @ X
+
+    'Noct', 'f0' and 'Tspeed' as per smoothSpectrum()
+
+    Operators are kept in a LRU cache keyed by the frequency grid hash
+    and the smoothing parameters.
+
+    Returns None if the operator would not fit into CACHE_MAXBYTES,
+    then use operator_chunks() instead.
+    """
+    global _cache_bytes
+
+    if not f0:
+        Tspeed = None
+    key = ( _hash(f), len(f), Noct, f0, Tspeed, nsigma )
+
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    Noct = noct_vector(f, Noct, f0, Tspeed)
+
+    # Estimated size: float64 weights and int32 indexes
+    if 12 * band_nnz(f, Noct, nsigma) > CACHE_MAXBYTES:
+        return None
+
+    N       = len(f)
+    start   = np.flatnonzero(f)[0]
+
+    # Bins below the first non zero frequency are not smoothed (identity)
+    data    = [ np.ones(start) ]
+    indices = [ np.arange(start, dtype=np.int32) ]
+    indptr  = [ np.arange(start, dtype=np.int32) ]
+    nnz     = start
+
+    # Joining the chunks rows as CSR arrays
+    for rows, cols, S in operator_chunks(f, Noct, nsigma):
+
+        if sparse.issparse(S):
+            data.append( S.data )
+            indices.append( S.indices + np.int32(cols.start) )
+            indptr.append( S.indptr[:-1] + nnz )
+
+        else:
+            nrows, width = S.shape
+            data.append( S.ravel() )
+            indices.append( np.tile( np.arange(cols.start, cols.stop, dtype=np.int32), nrows ) )
+            indptr.append( np.arange(nrows) * width + nnz )
+
+        nnz += len(data[-1])
+
+    indptr.append( [nnz] )
+
+    S = sparse.csr_matrix( ( np.concatenate(data),
+                             np.concatenate(indices),
+                             np.concatenate(indptr).astype(np.int32) ),
+                           shape=(N, N), copy=False )
+
+    nbytes = S.data.nbytes + S.indices.nbytes + S.indptr.nbytes
+    if nbytes > CACHE_MAXBYTES:
+        return S
+
+    # Storing, then evicting the least recently used ones if needed
+    _cache[key] = S
+    _cache_bytes += nbytes
+    while _cache_bytes > CACHE_MAXBYTES:
+        _, old = _cache.popitem(last=False)
+        _cache_bytes -= old.data.nbytes + old.indices.nbytes + old.indptr.nbytes
+
+    return S
+
+
+def cache_info():
+    """ Returns the number of cached smoothing operators and their size in bytes
+    """
+    return len(_cache), _cache_bytes
+
+
+def cache_clear():
+    """ Empties the smoothing operators cache
+    """
+    global _cache_bytes
+    _cache.clear()
+    _cache_bytes = 0
+
+
+def _hash(x):
+    return hashlib.sha1( np.ascontiguousarray(x, dtype=float).tobytes() ).hexdigest()
+
+
+def noct_vector(f, Noct, f0=0, Tspeed="medium"):
+    """
+    Returns the 1/Noct smoothing vector along the frequencies in 'f'.
+
+    If f0 = 0, then it is CONSTANT, otherwise Noct will transit
+    from N towards 1 from f0 (see tools.logTransition)
+    """
+    if f0:
+        return (Noct-1) * logTransition(f, f0, speed=Tspeed) + 1
+    else:
+        return Noct * np.ones( len(f) )
+
+
+def operator_chunks(f, Noct, nsigma=NSIGMA, chunk_nnz=CHUNK_NNZ):
+    """
+    Yields (rows, cols, S) pieces of the smoothing operator, where 'rows'
+    is a slice of the smoothed bins, 'cols' the slice of bins involved,
+    and 'S' a sparse (or dense, for wide windows) matrix so that
+
+        sX[rows] = S @ X[cols]
+
+    Each row of S is the Gaussian window (see gauss_f) centered at f[i],
+    cut off at 'nsigma' standard deviations and normalised to unity gain.
+
+    'f' must be ascending, 'Noct' is a vector of the same length as 'f'
+    (see noct_vector). Bins below the first non zero frequency are not
+    yielded, as they are not smoothed.
+
+    The rows are split so that no more than 'chunk_nnz' weights
+    are computed at once.
+    """
+    f                       = np.asarray(f, dtype=float)
+    start, fc, sigma, lo, hi = _bands(f, Noct, nsigma)
+    counts                  = hi - lo
+    cumnnz                  = np.cumsum(counts)
+
+    i = 0
+    while i < len(fc):
+
+        # rows from i to j will fit into 'chunk_nnz' weights (at least one row)
+        done = cumnnz[i-1] if i else 0
+        j = max( i + 1, int(np.searchsorted(cumnnz, done + chunk_nnz, side='right')) )
+
+        # the span of frequency indexes used by these rows
+        c0, c1  = lo[i:j].min(), hi[i:j].max()
+        c       = counts[i:j]
+        nnz     = cumnnz[j-1] - done
+        nsig    = -0.5 / sigma[i:j] ** 2
+
+        if (j - i) * (c1 - c0) <= 2 * nnz:
+            # The bands fill most of the span (wide windows), so a dense
+            # block is cheaper than indexing every weight one by one.
+            g  = f[None, c0:c1] - fc[i:j, None]
+            g *= g
+            g *= nsig[:, None]
+            np.exp(g, out=g)
+            g /= np.sum(g, axis=1, keepdims=True)                   # normalise magnitude
+            S  = g
+
+        else:
+            indptr  = np.concatenate( ([0], np.cumsum(c)) )
+            indices = np.arange(nnz) - np.repeat(indptr[:-1] - lo[i:j] + c0, c)
+
+            # Gaussian, computed in place as  exp( -(f_x - F)**2 / (2 * sigma**2) )
+            g  = f[c0:c1][indices]
+            g -= np.repeat( fc[i:j], c )
+            g *= g
+            g *= np.repeat( nsig, c )
+            np.exp(g, out=g)
+            g /= np.repeat( np.add.reduceat(g, indptr[:-1]), c )    # normalise magnitude
+            S  = sparse.csr_matrix( (g, indices, indptr), shape=(j - i, c1 - c0) )
+
+        yield slice(start + i, start + j), slice(c0, c1), S
+
+        i = j
+
+
+def band_nnz(f, Noct, nsigma=NSIGMA):
+    """ Number of weights inside the cut off Gaussian windows
+    """
+    _, _, _, lo, hi = _bands(np.asarray(f, dtype=float), Noct, nsigma)
+    return int( np.sum(hi - lo) )
+
+
+def _bands(f, Noct, nsigma):
+    """ Returns the first smoothed bin index, the centre frequencies,
+        their standard deviations and the band of frequency indexes
+        [lo, hi) inside each cut off Gaussian window.
+    """
+    start   = np.flatnonzero(f)[0]
+    fc      = f[start:]
+    sigma   = (fc / Noct[start:]) / np.pi                   # standard deviation
+    lo      = np.searchsorted(f, fc - nsigma * sigma, side='left')
+    hi      = np.searchsorted(f, fc + nsigma * sigma, side='right')
+    return start, fc, sigma, lo, hi
+
+
 def gauss_f(f_x, F , Noct):
     """
     GAUSS_F calculate frequency-domain Gaussian with unity gain
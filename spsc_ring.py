@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    A preallocated single producer / single consumer ring of fixed size
+    frames, to hand off results from an audio callback to a consumer
+    thread without locks nor memory allocation on the producer side.
+"""
+import time
+import numpy as np
+
+
+class SPSCRing(object):
+    """
+        A ring of 'nslots' preallocated frames of a given shape.
+
+        Only one thread must push (the producer, e.g. a PortAudio callback)
+        and only one thread must pop (the consumer). The producer only
+        writes .head and the consumer only writes .tail, each one after
+        the frame data is written or read, so no locks are needed.
+
+        When the ring is full the new frame is dropped, so the producer
+        never waits for a stalled consumer, and an overrun is counted.
+
+        r = SPSCRing(nslots, shape, dtype='float64')
+
+        .push(frame)        (producer) returns False if dropped (overrun)
+
+        .pop(out=None)      (consumer) returns the oldest frame,
+                            or None if the ring is empty
+
+        .get(timeout=None)  (consumer) waits for a frame, returns None
+                            if timeout
+
+        .depth              Frames waiting to be read
+
+        .max_depth          Max depth reached
+
+        .overruns           Frames dropped because the ring was full
+    """
+
+
+    # Consumer polling interval when waiting for frames (seconds)
+    POLL = 0.002
+
+
+    def __init__(self, nslots, shape, dtype='float64'):
+        self.nslots     = nslots
+        self.buf        = np.zeros( (nslots,) + tuple(np.atleast_1d(shape)),
+                                    dtype=dtype )
+        self.head       = 0     # frames written, producer owned
+        self.tail       = 0     # frames read, consumer owned
+        self.overruns   = 0
+        self.max_depth  = 0
+
+
+    @property
+    def depth(self):
+        return self.head - self.tail
+
+
+    def push(self, frame):
+        depth = self.head - self.tail
+        if depth >= self.nslots:
+            self.overruns += 1
+            return False
+        self.buf[ self.head % self.nslots ] = frame
+        # (i) published after the frame is written
+        self.head += 1
+        if depth + 1 > self.max_depth:
+            self.max_depth = depth + 1
+        return True
+
+
+    def pop(self, out=None):
+        if self.head == self.tail:
+            return None
+        frame = self.buf[ self.tail % self.nslots ]
+        if out is None:
+            out = frame.copy()
+        else:
+            out[...] = frame
+        # (i) released after the frame is read
+        self.tail += 1
+        return out
+
+
+    def get(self, timeout=None, out=None):
+        t0 = time.monotonic()
+        while True:
+            frame = self.pop(out)
+            if frame is not None:
+                return frame
+            if timeout is not None and time.monotonic() - t0 >= timeout:
+                return None
+            time.sleep(self.POLL)
@@ -261,6 +261,63 @@ def shelf2high(G, wc):
     return num, den
 
 
+def freqz_bank(b, a, w):
+    """ The complex frequency response of a bank of filters, as scipy freqz
+        but evaluated for all filters at once.
+
+        b, a:   coefficients arrays shaped (ncoef, nfilters), as given by
+                the shelfXXX functions when G or wc are arrays.
+                1-D arrays are taken as a single filter.
+        w:      normalized frequencies (rad/sample)
+
+        returns an array shaped (nfilters, len(w)), or (len(w),) for 1-D b, a
+    """
+    b = np.asarray(b)
+    a = np.asarray(a)
+    w = np.asarray(w)
+
+    # z^-k powers on the frequency grid, shaped (ncoef, len(w))
+    zb = np.exp( -1j * np.outer( np.arange(b.shape[0]), w ) )
+    za = np.exp( -1j * np.outer( np.arange(a.shape[0]), w ) )
+
+    return (b.T @ zb) / (a.T @ za)
+
+
+def shelf_response(freqs, G, fc, fs, order=1, btype='low', dB=True, deg=True):
+    """ The magnitude and phase table of a set of shelving filters,
+        all of them are evaluated on the freqs grid in one computation.
+
+        freqs:  the frequency grid (Hz)
+        G:      the shelf gain (linear, not dB), scalar or array
+        fc:     the shelf center frequency (Hz), scalar or array
+        order:  1 | 2  (see shelf1low, shelf2low, shelf1high, shelf2high)
+        btype:  'low' | 'high'
+
+        G and fc are broadcasted, so a table of curves can be computed
+        e.g. along a gains array for a given fc.
+
+        returns a tuple: (mag, pha) shaped (ncurves, len(freqs))
+    """
+    G, fc = np.broadcast_arrays( np.atleast_1d(np.asarray(G, dtype=float)),
+                                 np.atleast_1d(np.asarray(fc, dtype=float)) )
+
+    shelf = { ('low',  1): shelf1low,  ('low',  2): shelf2low,
+              ('high', 1): shelf1high, ('high', 2): shelf2high }[(btype, order)]
+
+    b, a = shelf(G, 2 * np.pi * fc / fs)
+
+    h = freqz_bank(b, a, np.asarray(freqs) * 2 * np.pi / fs)
+
+    if dB:
+        mag = 20 * np.log10( np.abs(h) )
+    else:
+        mag = np.abs(h)
+
+    pha = np.angle(h, deg=deg)
+
+    return mag, pha
+
+
 def semihann(m):
     """
     Obtiene la mitad derecha de una ventana Hann de longitud m.
@@ -337,7 +394,16 @@ def fir_response(imp, fs, oversample=1, dB=True, deg=True, clean_phase_dBthr=Non
     return freqs, mag, pha
 
 
-def min_phase_from_real_mag(f, sp_real, dB=True, deg=True, fs=44100):
+# min_phase_from_real_mag() automatic FFT length: starting from MINPHASE_MINFFT
+# the length is doubled until the retrieved phase changes less than
+# MINPHASE_TOL degrees, so that the cepstral aliasing (and the FFT grid
+# resolution) error is kept under it.
+MINPHASE_TOL    = 0.5
+MINPHASE_MINFFT = 2**12
+MINPHASE_MAXFFT = 2**18
+
+
+def min_phase_from_real_mag(f, sp_real, dB=True, deg=True, fs=44100, wsize=None):
     """
     Input:
 
@@ -351,6 +417,9 @@ def min_phase_from_real_mag(f, sp_real, dB=True, deg=True, fs=44100):
 
         deg:            Output phase given in deg instead of rad
 
+        wsize:          The FFT length, if None it is automatically chosen
+                        (see MINPHASE_TOL)
+
     Output:
 
         f:              Same frecuency bands as input
@@ -359,31 +428,66 @@ def min_phase_from_real_mag(f, sp_real, dB=True, deg=True, fs=44100):
 
         sp_mp_pha:      The computed min-phase phase
 
+    (i) For a table of curves see min_phase_from_real_mag_batch()
     """
 
+    f, sp_mp_mag, sp_mp_pha = min_phase_from_real_mag_batch(
+                                            f, sp_real[np.newaxis, :],
+                                            dB=dB, deg=deg, fs=fs, wsize=wsize )
+
+    return f, sp_mp_mag[0], sp_mp_pha[0]
+
+
+def min_phase_from_real_mag_batch(f, sp_reals, dB=True, deg=True, fs=44100,
+                                  wsize=None, dtype=None):
+    """
+    The same as min_phase_from_real_mag() but for a table of curves.
+
+    Input:
+
+        f:              An arbitrary spectrum of positive frequency bands.
+
+        sp_reals:       A 2-D array (curves x freqs) of real valued magnitudes.
+
+        dB, deg, fs:    As per min_phase_from_real_mag()
+
+        wsize:          The FFT length, if None it is automatically chosen
+                        (see MINPHASE_TOL)
+
+        dtype:          'float32' for a single precision FFT computation
+
+    Output:
+
+        f, sp_mp_mags, sp_mp_phas   (the last two are curves x freqs arrays)
+
+    The mapping to the FFT grid and back is shared by all curves,
+    and the FFTs run along the frequency axis of the whole table at once.
+    """
+
+    if sp_reals.ndim != 2:
+        raise ValueError("sp_reals must be a 2-d (curves x freqs) array")
+
     # From dB to linear
     if dB:
-        sp_real = 10 ** (sp_real / 20.0)
+        sp_reals = 10 ** (sp_reals / 20.0)
 
-    # From our custom spectrum to a full extended one by using
-    # even spaced bins from 0 Hz to Nyquist.
-    f_ext, sp_real_ext = fft_spectrum(f, sp_real, fs=fs)
+    if wsize:
+        sp_mp_mag, sp_mp_pha = _min_phase_on_fft_grid(f, sp_reals, fs, wsize, dtype)
 
-    # Obtains the whole minimum phase spectrum
-    # from our real valued specimen.
-    sp_mp = min_phase_wsp( whole_spectrum(sp_real_ext) )
+    else:
+        # Doubling the FFT length until the phase converges
+        wsize = max( MINPHASE_MINFFT, nearest_pow2(len(f)) )
+        sp_mp_mag, sp_mp_pha = _min_phase_on_fft_grid(f, sp_reals, fs, wsize, dtype)
 
-    # Getting magnitude and phase from the positive frequencies half
-    # of the obtained minimum phase:
-    N = len(f_ext)
-    sp_mp_mag = np.abs(sp_mp[:N])
-    sp_mp_pha = np.unwrap( np.angle( sp_mp[:N] ) )
+        while wsize < MINPHASE_MAXFFT:
 
-    # Remapping to the original 'f' frequencies
-    I_mag = interp1d(f_ext, sp_mp_mag)
-    I_pha = interp1d(f_ext, sp_mp_pha)
-    sp_mp_mag = I_mag(f)
-    sp_mp_pha = I_pha(f)
+            wsize *= 2
+            mag, pha = _min_phase_on_fft_grid(f, sp_reals, fs, wsize, dtype)
+
+            converged = np.max( np.abs(pha - sp_mp_pha) ) * 180 / np.pi < MINPHASE_TOL
+            sp_mp_mag, sp_mp_pha = mag, pha
+            if converged:
+                break
 
     # From linear to dB
     if dB:
@@ -396,33 +500,66 @@ def min_phase_from_real_mag(f, sp_real, dB=True, deg=True, fs=44100):
     return f, sp_mp_mag, sp_mp_pha
 
 
+def _min_phase_on_fft_grid(f, sp_reals, fs, wsize, dtype=None):
+    """ Linear magnitudes and phases (rad) of the minimum phase versions
+        of the 'sp_reals' curves, computed with a 'wsize' FFT length,
+        given at the original 'f' frequencies.
+    """
+
+    # From our custom spectrum to a full extended one by using
+    # even spaced bins from 0 Hz to Nyquist.
+    f_ext, sp_real_ext = fft_spectrum(f, sp_reals, fs=fs, wsize=wsize)
+
+    # Obtains the minimum phase semispectrum from our real valued
+    # specimen, by the real cepstrum method on the positive half.
+    # (i) As a log spectrum, its imaginary part is the unwrapped phase.
+    log_sp_mp = pydsd.minphssp( sp_real_ext, 2 * (len(f_ext) - 1),
+                                dtype=dtype, log=True )
+
+    # Getting magnitude and phase
+    sp_mp_mag = np.exp( log_sp_mp.real )
+    sp_mp_pha = log_sp_mp.imag
+
+    # Remapping to the original 'f' frequencies
+    I_mag = interp1d(f_ext, sp_mp_mag)
+    I_pha = interp1d(f_ext, sp_mp_pha)
+
+    return I_mag(f), I_pha(f)
+
+
 def min_phase_wsp(wsp):
     """
     input:  wps is a whole 'fft' kind of spectrum (real values, linear scaled).
+            It can be a 2-D array of spectra along the last axis.
     output: The corresponding minimum phase spectrum (complex values).
 
+    (i) It is computed from the positive half, see pydsd.minphssp()
+
     CREDITS: https://github.com/rripio/DSD
     """
 
-    if not wsp.ndim == 1:
-        raise ValueError("wsp must be a 1-d array")
+    if not wsp.ndim in (1, 2):
+        raise ValueError("wsp must be a 1-d or 2-d array")
 
-    mpwsp =  np.exp( np.conj( signal.hilbert( np.log(wsp) ) ) )
+    m = wsp.shape[-1]
+    ssp = pydsd.minphssp( wsp[..., :m//2+1], m )
+    nsp = np.flip( np.conj( ssp[..., 1:(m-1)//2+1] ), axis=-1 )
 
-    return mpwsp
+    return np.concatenate( (ssp, nsp), axis=-1 )
 
 
 def whole_spectrum(semi):
     """
     input:  semispectrum of positive freqs from 0 Hz to Nyq, must be ODD,
+            (or a 2-D array of them along the last axis)
     output: the whole spectrum as needed to FFT computation, will be EVEN.
     """
-    n = len(semi)
+    n = semi.shape[-1]
 
-    if (semi.ndim != 1) or (n % 2 == 0):
-        raise ValueError("whole_spectrum needs an ODD lenght 1-d array")
+    if (semi.ndim not in (1, 2)) or (n % 2 == 0):
+        raise ValueError("whole_spectrum needs an ODD lenght 1-d or 2-d array")
 
-    return np.concatenate(  ( semi, np.flipud( semi[1:n-1] )  )  )
+    return np.concatenate(  ( semi, np.flip( semi[..., 1:n-1], axis=-1 ) ), axis=-1  )
 
 
 def fft_spectrum(freq, mag, fs=44100, wsize=2**12, make_whole=False):
@@ -435,6 +572,8 @@ def fft_spectrum(freq, mag, fs=44100, wsize=2**12, make_whole=False):
                     it works for linear spaced or log spaced flawors,
                     even for arbitrary spaced bins.
 
+                    'mag' can be a 2-D array (curves x freqs).
+
         fs:         Fs will limit the Nyq of the output spectrum.
 
         wsize:      The window size to compute the output spectrum.
@@ -502,17 +641,15 @@ def semispectrum2impulse(semisp, dB=True):
     #     frequencies, but IFFT needs a CAUSAL spectrum (with minimum phase)
     #     also a WHOLE one (having positive and negative frequencies).
 
-    # This adds negative and positive freq-bins (real values)
-    wholesp = pydsd.wholespmp(semisp)
-
-    # This adds the minimum phase (complex values)
-    wholesp_mp = pydsd.minphsp( wholesp )
+    # This adds the minimum phase (complex values), the negative freq-bins
+    # are implicit as the IFFT of a real signal (irfft) will be used.
+    semisp_mp = pydsd.minphssp( semisp )
 
     # freq. domain  --> time domain
-    imp = np.real( scipy.fft.ifft( wholesp_mp ) )
+    taps = 2 * (len(semisp) - 1)                        # FIR taps
+    imp = scipy.fft.irfft( semisp_mp, taps )
 
     # Apply a window
-    taps = 2 * (len(semisp) - 1)                        # FIR taps
     imp = pydsd.semiblackmanharris(taps) * imp[:taps]
 
     return imp
@@ -635,28 +772,68 @@ def extrap1d(interpolator):
             Xtra  = extrap1d( I )
             Xtra([5, 45])   ----->  array([0.5, 0.5])
 
+        (i) It is a vectorized Extrap1d object (see below), so
+            a 2-D interpolator (e.g. a table of curves) will
+            extrapolate all curves at once.
     """
-    # https://stackoverflow.com/questions/2745329/how-to-make-scipy-interpolate-
-    # give-an-extrapolated-result-beyond-the-input-range
+    return Extrap1d(interpolator)
 
-    xs = interpolator.x
-    ys = interpolator.y
 
-    # linear extrapolation
-    def pointwise(x):
-        # below iso226.FREQS lower limit 20 Hz
-        if x < xs[0]:
-            return ys[0] + (x-xs[0]) * (ys[1]-ys[0]) / (xs[1]-xs[0])
-        # beyond iso226.FREQS upper limit 12.5 KHz
-        elif x > xs[-1]:
-            return ys[-1] + (x-xs[-1]) * (ys[-1]-ys[-2]) / (xs[-1]-xs[-2])
-        else:
-            return interpolator(x)
+class Extrap1d(object):
+    """ A linear extrapolator over an interpo1d interpolator.
+
+        Inside the interpolator range, values come from the interpolator,
+        beyond it they are linearly extrapolated with the slope of the two
+        edge points. The edge slopes are computed once, then any array of
+        points is evaluated in a single NumPy pass.
+
+        If the interpolator holds several curves, the output keeps the
+        curves along the interpolator axis and the points along the last one,
+        e.g.  interp1d(freqs, curves) --> Extrap1d(...)(new_freqs) is
+        a (curves x new_freqs) array.
+    """
 
-    def ufunclike(xs):
-        return np.array(list(map(pointwise, np.array(xs))))
+    def __init__(self, interpolator):
 
-    return ufunclike
+        # https://stackoverflow.com/questions/2745329/how-to-make-scipy-interpolate-
+        # give-an-extrapolated-result-beyond-the-input-range
+
+        self.interpolator = interpolator
+        self.axis         = interpolator.axis
+
+        xs = np.asarray(interpolator.x)
+        ys = np.moveaxis(np.asarray(interpolator.y), self.axis, -1)
+
+        self.x_lo = xs[0]
+        self.x_hi = xs[-1]
+        self.y_lo = ys[..., 0]
+        self.y_hi = ys[..., -1]
+        # below the lower limit (e.g. iso226.FREQS 20 Hz)
+        self.slope_lo = (ys[..., 1]  - ys[..., 0])  / (xs[1]  - xs[0])
+        # beyond the upper limit (e.g. iso226.FREQS 12.5 KHz)
+        self.slope_hi = (ys[..., -1] - ys[..., -2]) / (xs[-1] - xs[-2])
+
+
+    def __call__(self, x):
+
+        x = np.asarray(x, dtype=float)
+
+        lo = x < self.x_lo
+        hi = x > self.x_hi
+        mid = ~(lo | hi)
+
+        y_shape = self.y_lo.shape
+        y = np.empty( y_shape + x.shape )
+
+        # curves (if any) along the first axes, points along the last ones
+        def curves(v):
+            return np.reshape(v, y_shape + (1,))
+
+        y[..., lo]  = curves(self.y_lo) + (x[lo] - self.x_lo) * curves(self.slope_lo)
+        y[..., hi]  = curves(self.y_hi) + (x[hi] - self.x_hi) * curves(self.slope_hi)
+        y[..., mid] = np.moveaxis( self.interpolator(x[mid]), self.axis, -1 )
+
+        return y
 
 
 def logTransition(f, f0, speed="medium"):
@@ -970,21 +1147,46 @@ def readWAV(fname):
 
     """
 
-    fs, imp = wavfile.read(fname, mmap=True)
+    fs, imp = readWAV_raw(fname)
 
-    # Impulse type can vary, also the span values, see above table
+    # We want to use always 'float32'
+    return fs, pcm2float(imp, dtype='float32')
 
-    if imp.dtype == 'int32':
-        imp2 = imp / 2 ** 31      # -186 dB error on positive values can live with that
 
-    elif imp.dtype == 'int16':
-        imp2 = imp / 32768.0
+def readWAV_raw(fname):
+    """
+    Reads a wav file as a memory map, the data is not converted, so that
+    a long file can be processed by chunks without loading it in memory:
+
+        fs, raw = readWAV_raw(fname)
+        for i in range(0, len(raw), chunk_size):
+            x = pcm2float( raw[i : i + chunk_size] )
+            ...
+
+    returns: fs, raw data (see readWAV for the dtypes)
+    """
+    return wavfile.read(fname, mmap=True)
+
+
+def pcm2float(x, dtype='float64'):
+    """
+    Converts a chunk of raw wav data to float, normalized to +/- 1.0
+    (see the table at readWAV)
+    """
+    # The impulse type can vary, also the span values
+    if x.dtype == 'int32':
+        y = x / 2 ** 31      # -186 dB error on positive values can live with that
+
+    elif x.dtype == 'int16':
+        y = x / 32768.0
+
+    elif x.dtype == 'uint8':
+        y = (x - 128.0) / 128.0
 
     else:
-        imp2 = imp
+        y = x
 
-    # We want to use always 'float32'
-    return fs, imp2.astype('float32')
+    return y.astype(dtype, copy=False)
 
 
 def saveWAV(fname, rate, data, wav_dtype='int32'):